@@ -0,0 +1,102 @@
+import time
+from logger_handler import logger
+from frame_gate import FrameChangeGate
+from metrics import LatencyHistogram
+
+
+def poll_until(predicate, timeout=5.0, initial_delay=0.05, max_delay=1.0, factor=2.0):
+    """
+    以指数退避轮询predicate，条件满足时立即返回。
+
+    Returns:
+        (是否满足条件, 耗时秒数)
+    """
+    start = time.monotonic()
+    delay = initial_delay
+    while True:
+        if predicate():
+            return True, time.monotonic() - start
+        remaining = timeout - (time.monotonic() - start)
+        if remaining <= 0:
+            return False, time.monotonic() - start
+        time.sleep(min(delay, remaining))
+        delay = min(delay * factor, max_delay)
+
+
+def screen_changed():
+    """预期条件：画面相对点击前发生变化"""
+    return lambda verifier, frame, baseline: verifier.changed(frame, baseline)
+
+
+def text_appears(text):
+    """预期条件：画面中出现指定文本"""
+    return lambda verifier, frame, baseline: verifier.has_text(frame, text)
+
+
+def text_disappears(text):
+    """预期条件：画面中的指定文本消失"""
+    return lambda verifier, frame, baseline: not verifier.has_text(frame, text)
+
+
+class ActionVerifier:
+    """
+    带预期结果的点击动作。
+
+    点击后以指数退避的间隔截图检查预期条件，条件满足立即返回，
+    取代固定的sleep，同时按动作名称统计延迟直方图。
+    """
+    def __init__(self, automation, timeout=2.0, change_threshold=3.0):
+        """
+        Parameters:
+            automation: ScreenAutomation实例，用于截图、识别和执行命令
+            timeout: 默认的等待超时时间（秒）
+            change_threshold: 判断画面变化的缩略图分块平均灰度差阈值
+        """
+        self.automation = automation
+        self.timeout = timeout
+        self.gate = FrameChangeGate(change_threshold)
+        self.histograms = {}
+
+    def signature(self, frame):
+        """计算画面签名，作为点击前的基准"""
+        return self.gate.signature(frame)
+
+    def changed(self, frame, baseline):
+        """画面相对基准签名是否发生变化"""
+        if baseline is None:
+            return True
+        diff = self.gate.compare(self.signature(frame), baseline)
+        return diff is None or diff >= self.gate.threshold
+
+    def has_text(self, frame, text):
+        """画面中是否包含指定文本"""
+        return any(text in item[1] for item in self.automation._readtext("verify", frame))
+
+    def wait(self, condition, baseline=None, name="wait", timeout=None):
+        """等待预期条件满足，返回满足条件的那一帧画面，超时返回None；调用方可直接复用该帧，不必重新截图"""
+        timeout = self.timeout if timeout is None else timeout
+        matched = None
+
+        def check():
+            nonlocal matched
+            frame = self.automation._grab_frame()
+            if frame is not None and condition(self, frame, baseline):
+                matched = frame
+                return True
+            return False
+
+        ok, elapsed = poll_until(check, timeout)
+        self.histograms.setdefault(name, LatencyHistogram()).observe(elapsed)
+        if not ok:
+            logger.info(f"{name}：{timeout}秒内未满足预期条件")
+        return matched
+
+    def tap(self, x, y, expect=None, baseline=None, name="tap", timeout=None):
+        """点击坐标并等待预期条件（默认为画面发生变化），返回是否在超时前满足"""
+        self.automation._run_cmd(f'{self.automation.adb} shell input tap {x} {y}')
+        return self.wait(expect or screen_changed(), baseline, name, timeout) is not None
+
+    def report(self):
+        """输出各动作的延迟直方图"""
+        for name, histogram in self.histograms.items():
+            logger.info(f"动作延迟[{name}]：{histogram.summary()}")
@@ -0,0 +1,199 @@
+import shlex
+import socket
+import struct
+import subprocess
+import threading
+from logger_handler import logger
+
+# shell v2协议的数据包类型
+SHELL_STDOUT = 1
+SHELL_STDERR = 2
+SHELL_EXIT = 3
+
+
+class AdbError(Exception):
+    """adb服务端返回FAIL或连接异常"""
+
+
+class AdbServiceError(AdbError):
+    """设备已连接，但拒绝了请求的服务（如不支持shell v2）"""
+
+
+class AdbTransport:
+    """
+    直接通过本地5037端口与adb server通信的传输层。
+
+    每条命令只需建立一次本地TCP连接，省去每次fork shell和adb客户端进程的开销。
+    shell命令使用shell v2协议以获取退出码和stderr，不支持时退回v1协议；
+    exec-out命令按原始字节返回，用于截图等二进制输出。
+    """
+    def __init__(self, serial=None, host="127.0.0.1", port=5037, timeout=10):
+        """
+        Parameters:
+            serial: 设备序列号，为空时使用唯一连接的设备
+            host: adb server地址
+            port: adb server端口
+            timeout: 套接字超时时间（秒）
+        """
+        self.serial = serial
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.shell_v2 = True
+
+    @staticmethod
+    def _send(sock, request):
+        """按adb协议发送请求：4位十六进制长度+内容"""
+        data = request.encode('utf-8')
+        sock.sendall(b"%04x" % len(data) + data)
+
+    @staticmethod
+    def _recv_exact(sock, size):
+        """读取指定长度的数据"""
+        chunks = []
+        while size > 0:
+            chunk = sock.recv(size)
+            if not chunk:
+                raise AdbError("adb server连接已断开")
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    @classmethod
+    def _recv_all(cls, sock):
+        """读取数据直到连接关闭"""
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                return b"".join(chunks)
+            chunks.append(chunk)
+
+    @classmethod
+    def _check_okay(cls, sock):
+        """读取OKAY/FAIL状态，FAIL时抛出AdbError"""
+        status = cls._recv_exact(sock, 4)
+        if status == b"OKAY":
+            return
+        if status == b"FAIL":
+            length = int(cls._recv_exact(sock, 4), 16)
+            raise AdbError(cls._recv_exact(sock, length).decode('utf-8', errors='replace'))
+        raise AdbError(f"adb server返回未知状态：{status!r}")
+
+    def _open(self, service):
+        """连接adb server，切换到目标设备并打开服务"""
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        try:
+            self._send(sock, f"host:transport:{self.serial}" if self.serial else "host:transport-any")
+            self._check_okay(sock)
+            self._send(sock, service)
+            try:
+                self._check_okay(sock)
+            except AdbError as e:
+                raise AdbServiceError(str(e)) from e
+            return sock
+        except Exception:
+            sock.close()
+            raise
+
+    def shell(self, cmd):
+        """执行shell命令，返回stdout文本；退出码非零时抛出CalledProcessError"""
+        if self.shell_v2:
+            try:
+                sock = self._open(f"shell,v2,raw:{cmd}")
+            except AdbServiceError as e:
+                logger.info(f"设备不支持shell v2协议，改用v1协议：{e}")
+                self.shell_v2 = False
+            else:
+                with sock:
+                    return self._read_shell_v2(sock, cmd)
+        with self._open(f"shell:{cmd}") as sock:
+            return self._recv_all(sock).decode('utf-8', errors='replace')
+
+    def _read_shell_v2(self, sock, cmd):
+        """解析shell v2数据包，直到收到退出码"""
+        stdout, stderr = [], []
+        while True:
+            header = sock.recv(5)
+            if not header:
+                raise AdbError(f"shell命令未返回退出码：{cmd}")
+            if len(header) < 5:
+                header += self._recv_exact(sock, 5 - len(header))
+            packet_id, length = struct.unpack('<BI', header)
+            payload = self._recv_exact(sock, length) if length else b""
+            if packet_id == SHELL_STDOUT:
+                stdout.append(payload)
+            elif packet_id == SHELL_STDERR:
+                stderr.append(payload)
+            elif packet_id == SHELL_EXIT:
+                returncode = payload[0] if payload else 0
+                output = b"".join(stdout)
+                if returncode != 0:
+                    raise subprocess.CalledProcessError(returncode, cmd, output, b"".join(stderr))
+                return output.decode('utf-8', errors='replace')
+
+    def exec_out(self, cmd):
+        """执行exec-out命令，返回原始字节"""
+        with self._open(f"exec:{cmd}") as sock:
+            return self._recv_all(sock)
+
+    def batch(self, cmds):
+        """将多条shell命令（如多次input tap/swipe）合并为一次往返执行"""
+        return self.shell(" ; ".join(cmds))
+
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(serial=None):
+    """获取指定设备的传输层实例"""
+    with _transports_lock:
+        if serial not in _transports:
+            _transports[serial] = AdbTransport(serial)
+        return _transports[serial]
+
+
+def parse_adb_cmd(cmd):
+    """
+    解析"adb [-s serial] shell|exec-out ..."形式的命令。
+
+    Returns:
+        (serial, service, 设备端命令)，不是shell/exec-out命令时返回None
+    """
+    if not cmd.startswith("adb "):
+        return None
+    try:
+        argv = shlex.split(cmd)
+    except ValueError:
+        return None
+    serial = None
+    args = argv[1:]
+    if len(args) >= 2 and args[0] == "-s":
+        serial, args = args[1], args[2:]
+    if len(args) < 2 or args[0] not in ("shell", "exec-out"):
+        return None
+    return serial, args[0], " ".join(args[1:])
+
+
+def run_adb(cmd, binary=False):
+    """
+    通过adb server协议执行adb命令。
+
+    Returns:
+        命令输出；命令无法通过协议执行（如adb pull）或adb server未启动时返回None，由调用方回退到子进程
+    """
+    parsed = parse_adb_cmd(cmd)
+    if parsed is None:
+        return None
+    serial, service, device_cmd = parsed
+    transport = get_transport(serial)
+    try:
+        if service == "exec-out":
+            output = transport.exec_out(device_cmd)
+            return output if binary else output.decode('utf-8', errors='replace')
+        output = transport.shell(device_cmd)
+        return output.encode('utf-8') if binary else output
+    except ConnectionRefusedError as e:
+        logger.warning(f"无法连接adb server，回退到adb命令行：{e}")
+        return None
@@ -0,0 +1,172 @@
+import os
+import queue
+import threading
+from functools import lru_cache
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from logger_handler import logger
+from metrics import metrics
+
+FONT_PATH = "C:\\Windows\\Fonts\\STKAITI.TTF"  # 确保这个路径是正确的
+FORMATS = {
+    "png": (".png", cv2.IMWRITE_PNG_COMPRESSION),
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+
+
+@lru_cache(maxsize=None)
+def load_font(path=FONT_PATH, size=48):
+    """加载并缓存字体，字体文件不存在时使用PIL默认字体"""
+    try:
+        return ImageFont.truetype(path, size)
+    except OSError:
+        logger.warning(f"字体文件无法加载，使用默认字体：{path}")
+        return ImageFont.load_default()
+
+
+class FrameAnnotation:
+    """一帧画面上要标注的文本框和点击点，保存时才统一绘制"""
+    def __init__(self, frame):
+        self.frame = frame  # 原始画面，标注时在副本上绘制，不修改原数组
+        self.boxes = []
+        self.points = []
+
+    def add_box(self, bbox, text):
+        self.boxes.append((bbox, text))
+
+    def add_point(self, x, y, radius=15, color=(0, 255, 0)):
+        self.points.append((x, y, radius, color))
+
+
+class Annotator:
+    """
+    标注图像的后台写入器。
+
+    识别和点击过程中只记录文本框和点击点，保存请求放入队列后立即返回，
+    由后台线程一次性绘制全部标注并编码写入磁盘，点击不会等待图像编码。
+    enabled为False时不记录、不绘制也不写入任何标注图。
+    """
+    def __init__(self, output_dir, image_format="png", quality=90, scale=1.0, enabled=True, font_path=FONT_PATH,
+                 font_size=48, max_pending=8):
+        """
+        Parameters:
+            output_dir: 标注图保存目录
+            image_format: 图像格式，"png"、"jpeg"或"webp"
+            quality: jpeg/webp的质量（0-100）；png时换算为压缩级别，数值越高压缩越快、文件越大
+            scale: 保存前的缩放比例，小于1时缩小图像以减少编码耗时和磁盘占用
+            enabled: 为False时关闭标注
+            font_path: 标注文本使用的字体
+            font_size: 标注文本字号
+            max_pending: 等待写入的标注图上限，超过时丢弃新的标注图，不阻塞调用方
+        """
+        if image_format not in FORMATS:
+            raise ValueError(f"不支持的标注图格式：{image_format}，可选：{', '.join(FORMATS)}")
+        self.output_dir = output_dir
+        self.image_format = image_format
+        self.quality = quality
+        self.scale = scale
+        self.enabled = enabled
+        self.font_path = font_path
+        self.font_size = font_size
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self.written = 0
+        self.dropped = 0
+
+    def new(self, frame):
+        """开始标注一帧画面，关闭标注时返回None"""
+        return FrameAnnotation(frame) if self.enabled else None
+
+    def submit(self, annotation, filename):
+        """提交保存请求，立即返回"""
+        if annotation is None:
+            return
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._write_loop, name="Annotator", daemon=True)
+            self._thread.start()
+        # 复制标注列表，提交后同一帧继续添加的标注不影响已提交的图像
+        snapshot = FrameAnnotation(annotation.frame)
+        snapshot.boxes = list(annotation.boxes)
+        snapshot.points = list(annotation.points)
+        try:
+            self._queue.put_nowait((snapshot, filename))
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(f"标注图写入队列已满，丢弃：{filename}")
+
+    def render(self, annotation):
+        """在画面副本上绘制全部文本框和点击点"""
+        image = annotation.frame.copy()
+        for bbox, _ in annotation.boxes:
+            cv2.rectangle(image, (int(bbox[0][0]), int(bbox[0][1])), (int(bbox[2][0]), int(bbox[2][1])),
+                          (0, 255, 0), 2)
+        for x, y, radius, color in annotation.points:
+            if 0 <= x < image.shape[1] and 0 <= y < image.shape[0]:
+                cv2.circle(image, (int(x), int(y)), radius, color, -1)
+        if annotation.boxes:
+            # 中文文本只能用PIL绘制，整帧只转换一次
+            pil_image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+            draw = ImageDraw.Draw(pil_image)
+            font = load_font(self.font_path, self.font_size)
+            for bbox, text in annotation.boxes:
+                draw.text((bbox[0][0], bbox[0][1] - 20), text, font=font, fill=(225, 0, 255))
+            image = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
+        if self.scale != 1.0:
+            image = cv2.resize(image, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        return image
+
+    def _encode_params(self):
+        flag = FORMATS[self.image_format][1]
+        if self.image_format == "png":
+            return [flag, max(0, min(9, (100 - self.quality) // 10))]
+        return [flag, self.quality]
+
+    @metrics.timed("save")
+    def _write(self, annotation, filename):
+        path = os.path.join(self.output_dir, os.path.splitext(filename)[0] + FORMATS[self.image_format][0])
+        ok, data = cv2.imencode(FORMATS[self.image_format][0], self.render(annotation), self._encode_params())
+        if not ok:
+            raise ValueError(f"图像编码失败：{path}")
+        with open(path, 'wb') as f:
+            f.write(data.tobytes())  # cv2.imwrite不支持中文路径，先编码再写入
+        self.written += 1
+        logger.info(f"保存带有标记的图像: {path}")
+
+    def _write_loop(self):
+        """后台线程：依次绘制并写入标注图"""
+        while True:
+            item = self._queue.get()
+            if item is None:  # close()发出的停止信号
+                self._queue.task_done()
+                return
+            annotation, filename = item
+            try:
+                self._write(annotation, filename)
+            except Exception as e:
+                logger.error(f"保存带有标记的图像失败: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    def flush(self, timeout=10):
+        """等待已提交的标注图写入完毕"""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        threading.Thread(target=lambda: (self._queue.join(), done.set()), daemon=True).start()
+        if not done.wait(timeout):
+            logger.warning(f"{timeout}秒内未写完标注图，剩余{self._queue.qsize()}张")
+
+    def close(self, timeout=10):
+        """写完已提交的标注图后结束后台线程，之后再提交时会重新启动线程"""
+        if self._thread is None:
+            return
+        self.flush(timeout)
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            logger.warning("标注图写入线程未能及时结束")
+            return
+        self._thread.join(timeout)
+        self._thread = None
@@ -0,0 +1,151 @@
+import json
+import os
+import time
+from pathlib import Path
+from logger_handler import logger
+from actions import poll_until
+from metrics import metrics, safe_name
+from units7 import run_cmd
+
+project_path = Path(__file__).parent
+ready_stats_path = project_path / 'out_files' / 'app_ready.json'
+
+
+class AppLifecycle:
+    """
+    游戏app的启动、就绪检测与关闭。
+
+    启动后轮询dumpsys确认MessiahNativeActivity获得焦点，再等待画面稳定且不是纯色加载页，
+    取代固定的sleep。warm模式下关闭时只退到后台，下次启动直接切回前台，避免每次冷启动。
+    每次的就绪耗时按包名记录到out_files/app_ready.json，指定设备序列号时按设备分别记录到app_ready_<序列号>.json。
+    """
+    def __init__(self, package, activity="com.netease.game.MessiahNativeActivity", warm=False,
+                 stats_path=None, history=20, serial=None):
+        """
+        Parameters:
+            package: app包名
+            activity: 主Activity类名
+            warm: 是否保持app常驻，只在前后台之间切换
+            stats_path: 就绪耗时记录文件，为None时按设备序列号选择默认文件，多设备并行时各进程不会写同一个文件
+            history: 每个包名保留的就绪耗时记录条数
+            serial: 设备序列号，为空时使用adb默认设备
+        """
+        self.package = package
+        self.serial = serial
+        self.adb = f"adb -s {serial}" if serial else "adb"
+        self.activity = activity
+        self.warm = warm
+        if stats_path is None:
+            stats_path = ready_stats_path.with_name(f"app_ready_{safe_name(serial)}.json") if serial else ready_stats_path
+        self.stats_path = stats_path
+        self.history = history
+        self.start_mode = None
+        self._started_at = None
+
+    @property
+    def component(self):
+        return f"{self.package}/{self.activity}"
+
+    @property
+    def stats_key(self):
+        """就绪耗时记录的键，多设备时区分序列号"""
+        return f"{self.package}@{self.serial}" if self.serial else self.package
+
+    def is_running(self):
+        """app进程是否存在"""
+        # pidof在进程不存在时返回非零，追加true避免被当作命令失败
+        return bool(run_cmd(f'{self.adb} shell "pidof {self.package}; true"').strip())
+
+    def is_focused(self):
+        """主Activity是否处于前台焦点"""
+        output = run_cmd(f'{self.adb} shell dumpsys window')
+        for line in output.splitlines():
+            if ("mCurrentFocus" in line or "mFocusedApp" in line) and self.component in line:
+                return True
+        output = run_cmd(f'{self.adb} shell dumpsys activity activities')
+        for line in output.splitlines():
+            if "ResumedActivity" in line and self.component in line:
+                return True
+        return False
+
+    @metrics.timed("app_start")
+    def start(self):
+        """启动app；warm模式下若已在后台运行则直接切回前台"""
+        self.start_mode = "warm" if self.warm and self.is_running() else "cold"
+        self._started_at = time.monotonic()
+        run_cmd(f'{self.adb} shell am start -n {self.component}')
+        logger.info(f"{self.package}以{'热' if self.start_mode == 'warm' else '冷'}启动方式启动")
+
+    @metrics.timed("app_stop")
+    def stop(self):
+        """关闭app；warm模式下只返回桌面，保持进程常驻"""
+        if self.warm:
+            run_cmd(f'{self.adb} shell input keyevent KEYCODE_HOME')
+            logger.info(f"{self.package}已切到后台")
+            return
+        run_cmd(f'{self.adb} shell am force-stop {self.package}')
+        poll_until(lambda: not self.is_running(), timeout=3)
+
+    @metrics.timed("app_ready")
+    def wait_ready(self, automation, timeout=60, stable_time=1.5, min_contrast=8.0):
+        """
+        等待app就绪：主Activity获得焦点后，画面在stable_time秒内保持不变且不是纯色画面。
+
+        Parameters:
+            automation: ScreenAutomation实例，用于截图和计算画面签名
+            timeout: 最长等待时间（秒）
+            stable_time: 画面需保持稳定的时间（秒）
+            min_contrast: 缩略图灰度标准差下限，低于该值视为黑屏/白屏等加载画面
+        Returns:
+            就绪耗时（秒），超时返回None
+        """
+        start = self._started_at or time.monotonic()
+        deadline = time.monotonic() + timeout
+        focused, _ = poll_until(self.is_focused, timeout=timeout, initial_delay=0.2, max_delay=1.0)
+        if not focused:
+            logger.warning(f"{self.package}在{timeout}秒内未获得焦点")
+            return None
+
+        state = {"signature": None, "since": None}
+
+        def frame_stable():
+            frame = automation._grab_frame()
+            if frame is None:
+                return False
+            automation.recorder.record_frame(frame, stage="wait_ready")
+            signature = automation.verifier.signature(frame)
+            now = time.monotonic()
+            if signature.std() < min_contrast or automation.verifier.changed(frame, state["signature"]):
+                state["signature"], state["since"] = signature, now
+                return False
+            return now - state["since"] >= stable_time
+
+        stable, _ = poll_until(frame_stable, timeout=max(0.0, deadline - time.monotonic()),
+                               initial_delay=0.2, max_delay=0.5)
+        if not stable:
+            logger.warning(f"{self.package}在{timeout}秒内画面未稳定")
+            automation.recorder.dump("not_ready")
+            return None
+
+        elapsed = time.monotonic() - start
+        logger.info(f"{self.package}{'热' if self.start_mode == 'warm' else '冷'}启动就绪耗时{elapsed:.1f}秒")
+        self._record(elapsed)
+        return elapsed
+
+    def _record(self, elapsed):
+        """记录就绪耗时"""
+        try:
+            stats = {}
+            if os.path.exists(self.stats_path):
+                with open(self.stats_path, encoding='utf-8') as f:
+                    stats = json.load(f)
+            records = stats.setdefault(self.stats_key, {}).setdefault(self.start_mode or "cold", [])
+            records.append(round(elapsed, 2))
+            del records[:-self.history]
+            os.makedirs(os.path.dirname(self.stats_path), exist_ok=True)
+            temp_path = f"{self.stats_path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(stats, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.stats_path)
+        except Exception as e:
+            logger.error(f"记录就绪耗时失败：{e}", exc_info=True)
@@ -0,0 +1,296 @@
+"""
+离线回放基准测试：不需要手机和游戏，用录制的截图替代设备，测量各阶段耗时、帧率和内存峰值。
+
+用法：
+    python benchmark.py <截图目录或飞行记录.npz> [--record] [--mode frames|run|all]
+
+截图目录中的图片按文件名排序依次回放；每次点击后假设备切换到下一张截图，模拟界面响应。
+目录中的taps.json为各运行方式下预期的点击序列，--record时用本次的点击结果生成该文件，
+之后每次运行都会比对点击坐标是否一致，不一致时以非零状态码退出，便于在CI中比较不同版本。
+"""
+import argparse
+import functools
+import inspect
+import json
+import os
+import re
+import struct
+import sys
+import tempfile
+import time
+from pathlib import Path
+import cv2
+import numpy as np
+
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".webp", ".bmp")
+STAGES = ("capture", "decode", "layout", "ocr", "match", "click", "annotate", "save")
+
+
+def load_corpus(path):
+    """读取截图目录或飞行记录归档，返回BGR图像列表"""
+    path = Path(path)
+    if path.suffix == ".npz":
+        with np.load(path) as archive:
+            return [archive[key] for key in sorted(archive.files)]
+    frames = []
+    for file in sorted(p for p in path.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES):
+        frame = cv2.imdecode(np.fromfile(str(file), dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is not None:
+            frames.append(frame)
+    return frames
+
+
+def encode_raw_frame(frame):
+    """按screencap（不带-p）的格式编码画面：16字节帧头加RGBA像素"""
+    height, width = frame.shape[:2]
+    rgba = cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA)
+    return struct.pack('<IIII', width, height, 1, 0) + rgba.tobytes()
+
+
+class StageTimer:
+    """按阶段汇总耗时"""
+    def __init__(self):
+        self.samples = {}
+
+    def add(self, stage, elapsed):
+        self.samples.setdefault(stage, []).append(elapsed)
+
+    def wrap(self, stage, func):
+        """返回计时后的函数"""
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+        return timed
+
+    def summary(self):
+        result = {}
+        for stage in list(STAGES) + [s for s in self.samples if s not in STAGES]:
+            values = sorted(self.samples.get(stage, []))
+            if not values:
+                continue
+            result[stage] = {
+                "count": len(values),
+                "mean_ms": sum(values) / len(values) * 1000,
+                "p50_ms": values[len(values) // 2] * 1000,
+                "p95_ms": values[min(len(values) - 1, int(len(values) * 0.95))] * 1000,
+                "max_ms": values[-1] * 1000,
+            }
+        return result
+
+
+class FakeDevice:
+    """
+    代替adb的假设备：按顺序提供录制的截图，记录点击。
+
+    截图命令返回当前截图（原始帧或PNG），点击后切换到下一张截图，其余命令返回空结果。
+    """
+    TAP_PATTERN = re.compile(r'input tap (\d+) (\d+)')
+
+    def __init__(self, frames, timer):
+        self.frames = frames
+        self.timer = timer
+        self.index = 0
+        self.taps = []
+        self._raw = {}
+        self._png = {}
+        self._started = time.perf_counter()
+
+    def _current(self):
+        return min(self.index, len(self.frames) - 1)
+
+    def run_cmd(self, cmd, binary=False):
+        """与units7.run_cmd的参数和返回值一致"""
+        start = time.perf_counter()
+        index = self._current()
+        if 'screencap -p' in cmd:
+            if index not in self._png:
+                self._png[index] = cv2.imencode(".png", self.frames[index])[1].tobytes()
+            output = self._png[index]
+        elif 'screencap' in cmd:
+            if index not in self._raw:
+                self._raw[index] = encode_raw_frame(self.frames[index])
+            output = self._raw[index]
+        else:
+            match = self.TAP_PATTERN.search(cmd)
+            if match:
+                self.taps.append({"x": int(match.group(1)), "y": int(match.group(2)), "frame": index,
+                                  "time": round(time.perf_counter() - self._started, 4)})
+                self.index += 1
+            output = b"" if binary else ""
+        if 'screencap' in cmd:
+            self.timer.add("capture", time.perf_counter() - start)
+        return output
+
+
+def peak_rss():
+    """进程内存峰值（MB），无法获取时返回None"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / 1024 / 1024
+        except (ImportError, AttributeError):
+            return None
+
+
+def instrument(automation, device, timer):
+    """把自动化实例的设备命令换成假设备，并给各阶段加上计时"""
+    import units7
+    automation._run_cmd = device.run_cmd
+    automation._readtext = timer.wrap("ocr", automation._readtext)
+    automation._click_position = timer.wrap("click", automation._click_position)
+    if automation.layout is not None:
+        automation.layout.find = timer.wrap("layout", automation.layout.find)
+    # 规则引擎和解码函数在进程内共享，先去掉上一次运行的计时再重新包装
+    automation.rules.match = timer.wrap("match", inspect.unwrap(automation.rules.match))
+    automation.annotator.render = timer.wrap("annotate", automation.annotator.render)
+    automation.annotator._write = timer.wrap("save", automation.annotator._write)
+    units7.decode_raw_frame = timer.wrap("decode", inspect.unwrap(units7.decode_raw_frame))
+
+
+def run_frames(frames, options, output_dir):
+    """逐帧调用find_and_click_text，测量单帧处理延迟"""
+    from units7 import ScreenAutomation
+    timer = StageTimer()
+    device = FakeDevice(frames, timer)
+    automation = ScreenAutomation(output_dir=output_dir, **options)
+    instrument(automation, device, timer)
+    start = time.perf_counter()
+    for index in range(len(frames)):
+        device.index = index
+        frame_start = time.perf_counter()
+        automation.find_and_click_text()
+        timer.add("frame", time.perf_counter() - frame_start)
+    elapsed = time.perf_counter() - start
+    automation.close()
+    return {"frames": len(frames), "elapsed": elapsed, "fps": len(frames) / elapsed if elapsed else 0.0,
+            "stages": timer.summary(), "taps": device.taps}
+
+
+def run_loop(frames, options, output_dir):
+    """运行完整的run_main主循环"""
+    from units7 import ScreenAutomation
+    timer = StageTimer()
+    device = FakeDevice(frames, timer)
+    automation = ScreenAutomation(output_dir=output_dir, **options)
+    instrument(automation, device, timer)
+    automation.find_and_click_text = timer.wrap("frame", automation.find_and_click_text)
+    start = time.perf_counter()
+    automation.run_main()
+    elapsed = time.perf_counter() - start
+    loops = len(timer.samples.get("frame", []))
+    return {"frames": loops, "elapsed": elapsed, "fps": loops / elapsed if elapsed else 0.0,
+            "stages": timer.summary(), "taps": device.taps}
+
+
+def compare_taps(expected, actual, tolerance=0):
+    """比较点击序列，返回不一致的描述列表"""
+    problems = []
+    if len(expected) != len(actual):
+        problems.append(f"点击次数不一致：预期{len(expected)}次，实际{len(actual)}次")
+    for i, (want, got) in enumerate(zip(expected, actual)):
+        if abs(want["x"] - got["x"]) > tolerance or abs(want["y"] - got["y"]) > tolerance:
+            problems.append(f"第{i + 1}次点击坐标不一致：预期({want['x']}, {want['y']})，实际({got['x']}, {got['y']})")
+    return problems
+
+
+def print_report(name, result):
+    print(f"\n== {name}：{result['frames']}帧，耗时{result['elapsed']:.2f}秒，{result['fps']:.2f}帧/秒，"
+          f"点击{len(result['taps'])}次")
+    print(f"{'阶段':<10}{'次数':>6}{'平均ms':>10}{'p50ms':>10}{'p95ms':>10}{'最大ms':>10}")
+    for stage, stats in result["stages"].items():
+        print(f"{stage:<10}{stats['count']:>6}{stats['mean_ms']:>10.1f}{stats['p50_ms']:>10.1f}"
+              f"{stats['p95_ms']:>10.1f}{stats['max_ms']:>10.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="离线回放基准测试")
+    parser.add_argument("corpus", help="截图目录或飞行记录.npz")
+    parser.add_argument("--mode", choices=("frames", "run", "all"), default="all")
+    parser.add_argument("--taps", help="预期点击序列文件，默认为截图目录下的taps.json")
+    parser.add_argument("--record", action="store_true", help="用本次的点击结果生成预期点击序列")
+    parser.add_argument("--tolerance", type=int, default=0, help="点击坐标允许的偏差（像素）")
+    parser.add_argument("--cache", choices=("off", "memory"), default="memory",
+                        help="OCR识别缓存，基准测试不读写持久化缓存，保证每次运行条件一致")
+    parser.add_argument("--capture-mode", choices=("raw", "file"), default="raw")
+    parser.add_argument("--no-gate", action="store_true", help="关闭画面变化检测")
+    parser.add_argument("--no-roi", action="store_true", help="始终全屏识别")
+    parser.add_argument("--no-templates", action="store_true", help="关闭模板匹配")
+    parser.add_argument("--no-layout", action="store_true", help="关闭布局缓存，每帧都经过OCR")
+    parser.add_argument("--no-annotate", action="store_true", help="不保存标注图")
+    parser.add_argument("--json", help="把结果写入JSON文件")
+    args = parser.parse_args(argv)
+
+    from ocr_engine import configure_ocr_engine
+    engine = configure_ocr_engine(cache_size=0 if args.cache == "off" else 2048, cache_path=None)
+    engine.use_service = False  # 只测量本进程内的识别
+
+    frames = load_corpus(args.corpus)
+    if not frames:
+        parser.error(f"没有可回放的截图：{args.corpus}")
+    options = {"capture_mode": args.capture_mode, "ocr_gate_threshold": None if args.no_gate else 2.0,
+               "use_roi": not args.no_roi, "use_templates": not args.no_templates,
+               "annotate": not args.no_annotate, "use_layout_cache": not args.no_layout}
+    corpus = Path(args.corpus)
+    taps_path = Path(args.taps) if args.taps else (corpus if corpus.is_dir() else corpus.parent) / "taps.json"
+
+    results = {}
+    load_start = time.perf_counter()
+    engine.warm_up()
+    results["model_load"] = time.perf_counter() - load_start
+    with tempfile.TemporaryDirectory() as output_dir:
+        if args.mode in ("frames", "all"):
+            results["frames"] = run_frames(frames, options, os.path.join(output_dir, "frames"))
+            print_report("逐帧识别", results["frames"])
+        if args.mode in ("run", "all"):
+            results["run"] = run_loop(frames, options, os.path.join(output_dir, "run"))
+            print_report("主循环", results["run"])
+    results["peak_rss_mb"] = peak_rss()
+    print(f"\n模型加载{results['model_load']:.2f}秒，内存峰值"
+          + (f"{results['peak_rss_mb']:.0f}MB" if results["peak_rss_mb"] is not None else "未知"))
+
+    results["ocr"] = engine.stats()
+    if results["ocr"]["cache"]:
+        cache = results["ocr"]["cache"]
+        print(f"OCR识别缓存命中率{cache['hit_ratio']:.1%}，节省识别时间约{cache['time_saved']:.2f}秒")
+
+    # 预期点击序列按运行方式分别保存
+    taps = {mode: [{"x": tap["x"], "y": tap["y"]} for tap in results[mode]["taps"]]
+            for mode in ("frames", "run") if mode in results}
+    exit_code = 0
+    if args.record:
+        expected = {}
+        if taps_path.exists():
+            with open(taps_path, encoding='utf-8') as f:
+                expected = json.load(f)
+        expected.update(taps)
+        with open(taps_path, 'w', encoding='utf-8') as f:
+            json.dump(expected, f, ensure_ascii=False, indent=2)
+        print(f"已记录点击序列：{taps_path}")
+    elif taps_path.exists():
+        with open(taps_path, encoding='utf-8') as f:
+            expected = json.load(f)
+        problems = []
+        for mode, actual in taps.items():
+            if mode in expected:
+                problems += [f"[{mode}]{problem}" for problem in compare_taps(expected[mode], actual, args.tolerance)]
+        for problem in problems:
+            print(problem)
+        print("点击序列一致" if not problems else f"点击序列不一致，共{len(problems)}处")
+        exit_code = 1 if problems else 0
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
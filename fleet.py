@@ -0,0 +1,183 @@
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import yaml
+from logger_handler import flush_logs, logger
+
+project_path = Path(__file__).parent
+fleet_path = project_path / 'fleet.yaml'
+
+
+def load_fleet(path=fleet_path):
+    """读取多设备配置，文件不存在时返回空列表"""
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        config = yaml.safe_load(f) or {}
+    devices = config.get("devices") or []
+    for device in devices:
+        if not device.get("serial") or not device.get("package"):
+            raise ValueError(f"设备配置缺少serial或package：{device}")
+        device.setdefault("name", device["serial"])
+    return devices
+
+
+def run_device(device, ocr_threads=None, max_attempts=2, start_at=None, ready_queue=None):
+    """
+    在独立进程中运行单个设备的完整流程：加载模型、启动app、等待就绪、执行主循环、关闭app。
+
+    Parameters:
+        device: 设备配置
+        ocr_threads: 本进程的OCR推理线程数
+        max_attempts: 最多尝试次数
+        start_at: 开始主循环的时间（time.time()），app就绪后等到该时间再开始，为None时就绪后立即开始
+        ready_queue: 就绪（或第一次尝试失败）时放入设备名，供主进程等待所有设备预热完成
+
+    Returns:
+        该设备的运行结果与各阶段耗时
+    """
+    from app_lifecycle import AppLifecycle
+    from metrics import configure_metrics, safe_name
+    from ocr_engine import cache_path, configure_ocr_engine, get_ocr_engine
+    from units7 import ScreenAutomation
+
+    # 各设备进程分别持久化识别缓存，避免多个进程同时读写同一个文件
+    configure_ocr_engine(cache_path=cache_path.with_name(f"ocr_cache_{safe_name(device['name'])}.json"))
+    if ocr_threads:
+        get_ocr_engine().num_threads = ocr_threads
+    metrics = configure_metrics(device=device["name"])
+    special_clicks = {k: tuple(v) for k, v in (device.get("special_clicks") or {}).items()}
+    app = AppLifecycle(device["package"], device.get("activity", "com.netease.game.MessiahNativeActivity"),
+                       warm=device.get("warm", False), serial=device["serial"])
+    result = {"name": device["name"], "serial": device["serial"], "ok": False, "attempts": 0,
+              "ready_time": None, "run_time": None, "total_time": None, "first_tap_at": None, "error": None}
+    start = time.monotonic()
+    notified = False
+
+    def notify_ready():
+        """通知主进程该设备已完成预热，只通知一次"""
+        nonlocal notified
+        if ready_queue is not None and not notified:
+            ready_queue.put(device["name"])
+            notified = True
+
+    get_ocr_engine().warm_up()
+    while result["attempts"] < max_attempts:
+        result["attempts"] += 1
+        automation = None
+        try:
+            app.start()
+            automation = ScreenAutomation(serial=device["serial"], special_clicks=special_clicks,
+                                          layout_key=f"{device['serial']}_{device['package']}")
+            result["ready_time"] = app.wait_ready(automation, timeout=device.get("ready_timeout", 60))
+            if result["ready_time"] is None:
+                # 超时未就绪时关闭app后重试，不在未就绪的画面上执行主循环
+                automation.close()
+                app.stop()
+                raise RuntimeError(f"{device['package']}启动后未就绪")
+            notify_ready()
+            if start_at is not None and start_at > time.time():
+                logger.info(f"[{device['name']}]已就绪，等待{start_at - time.time():.1f}秒后开始")
+                time.sleep(start_at - time.time())
+            run_start = time.monotonic()
+            automation.run_main()
+            result["run_time"] = time.monotonic() - run_start
+            app.stop()
+            result["ok"] = True
+            result["error"] = None
+            break
+        except Exception as e:
+            logger.error(f"[{device['name']}]运行过程中出现错误：{e}", exc_info=True)
+            result["error"] = str(e)
+            notify_ready()  # 第一次尝试失败时不再让主进程等待
+        finally:
+            if automation is not None and result["first_tap_at"] is None:
+                result["first_tap_at"] = automation.first_tap_at
+    result["total_time"] = time.monotonic() - start
+    metrics.flush(run=device["name"])
+    flush_logs()
+    return result
+
+
+class FleetRun:
+    """
+    多设备并行运行，每个设备一个工作进程，按CPU核数为每个进程分配OCR推理线程。
+
+    创建后工作进程立即开始加载模型、启动app并等待就绪；指定start_at时就绪后等到该时间才开始主循环，
+    预热阶段用wait_ready()等待所有设备就绪，购买时间到达后用results()收集结果。
+    """
+    def __init__(self, devices, start_at=None, cpu_count=None):
+        """
+        Parameters:
+            devices: 设备配置列表（见load_fleet）
+            start_at: 开始主循环的时间（time.time()），为None时就绪后立即开始
+            cpu_count: 可用的CPU核数，默认为本机核数
+        """
+        self.devices = devices
+        cpu_count = cpu_count or os.cpu_count() or 1
+        ocr_threads = max(1, cpu_count // len(devices))
+        logger.info(f"开始并行运行{len(devices)}台设备，每个进程OCR线程数{ocr_threads}")
+        self._manager = multiprocessing.Manager()
+        self._ready_queue = self._manager.Queue()
+        self._executor = ProcessPoolExecutor(max_workers=len(devices))
+        self._futures = {self._executor.submit(run_device, device, ocr_threads, start_at=start_at,
+                                               ready_queue=self._ready_queue): device for device in devices}
+
+    def wait_ready(self, timeout=300):
+        """等待所有设备完成预热（就绪、失败或工作进程退出），返回已就绪的设备名"""
+        ready = set()
+        deadline = time.monotonic() + timeout
+        while len(ready) < len(self.devices) and time.monotonic() < deadline:
+            try:
+                ready.add(self._ready_queue.get(timeout=1))
+            except queue.Empty:
+                if all(future.done() for future in self._futures):
+                    break
+        pending = [device["name"] for device in self.devices if device["name"] not in ready]
+        if pending:
+            logger.warning(f"以下设备未在预热阶段就绪：{', '.join(pending)}")
+        return ready
+
+    def results(self):
+        """等待所有设备运行结束，返回各设备的运行结果列表"""
+        results = []
+        for future in as_completed(self._futures):
+            device = self._futures[future]
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.error(f"[{device['name']}]工作进程异常退出：{e}", exc_info=True)
+                results.append({"name": device["name"], "serial": device["serial"], "ok": False, "error": str(e)})
+        self._executor.shutdown()
+        self._manager.shutdown()
+        _log_results(results)
+        return results
+
+
+def run_fleet(devices, cpu_count=None):
+    """
+    每个设备一个工作进程并行运行，各设备就绪后立即开始。
+
+    Returns:
+        各设备的运行结果列表
+    """
+    if not devices:
+        return []
+    return FleetRun(devices, cpu_count=cpu_count).results()
+
+
+def _log_results(results):
+    """输出各设备的运行结果"""
+    for result in results:
+        logger.info(f"[{result['name']}]({result['serial']}) {'成功' if result['ok'] else '失败'}，"
+                    f"就绪{_seconds(result.get('ready_time'))}，主循环{_seconds(result.get('run_time'))}，"
+                    f"总计{_seconds(result.get('total_time'))}，尝试{result.get('attempts', 0)}次"
+                    + (f"，错误：{result['error']}" if result.get('error') else ""))
+
+
+def _seconds(value):
+    """格式化耗时"""
+    return "-" if value is None else f"{value:.1f}秒"
@@ -0,0 +1,167 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+import cv2
+import numpy as np
+from logger_handler import logger
+from metrics import metrics
+
+project_path = Path(__file__).parent
+records_path = project_path / 'out_files' / 'flight_records'
+
+
+def prune_directory(path, max_files=None, max_bytes=None, max_age=None, suffixes=None):
+    """
+    按数量、总大小和保存时间清理目录中最旧的文件。
+
+    Parameters:
+        path: 目录路径
+        max_files: 最多保留的文件数
+        max_bytes: 最多占用的磁盘空间（字节）
+        max_age: 文件最长保存时间（秒）
+        suffixes: 只清理这些后缀的文件，为None时清理所有文件
+
+    Returns:
+        删除的文件数
+    """
+    if not os.path.isdir(path):
+        return 0
+    files = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_file() and (suffixes is None or entry.name.endswith(tuple(suffixes))):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+    files.sort(reverse=True)  # 最新的在前
+    now = time.time()
+    kept_bytes = 0
+    removed = 0
+    for index, (mtime, size, file_path) in enumerate(files):
+        expired = ((max_age is not None and now - mtime > max_age)
+                   or (max_files is not None and index >= max_files)
+                   or (max_bytes is not None and kept_bytes + size > max_bytes))
+        if not expired:
+            kept_bytes += size
+            continue
+        try:
+            os.remove(file_path)
+            removed += 1
+        except OSError as e:
+            logger.error(f'无法删除 {file_path}。原因: {e}')
+    return removed
+
+
+class FlightRecorder:
+    """
+    飞行记录器：在内存中保留最近若干帧画面及其识别结果和动作。
+
+    运行失败或遇到结束条件时才把缓冲区写成一个压缩的.npz归档和一个JSON说明文件，
+    平时不产生任何磁盘读写；归档按数量、总大小和保存时间自动清理。
+    """
+    def __init__(self, capacity=40, scale=0.5, max_bytes=64 * 1024 * 1024, output_dir=records_path,
+                 max_archives=20, max_total_bytes=512 * 1024 * 1024, max_age=7 * 24 * 3600, name=""):
+        """
+        Parameters:
+            capacity: 最多保留的帧数
+            scale: 帧缩放比例，缩小后保存以控制内存占用
+            max_bytes: 缓冲区帧数据的内存上限（字节），超过时丢弃最旧的帧
+            output_dir: 归档保存目录
+            max_archives: 最多保留的归档数
+            max_total_bytes: 归档占用磁盘空间上限（字节）
+            max_age: 归档最长保存时间（秒）
+            name: 归档文件名中的设备标识
+        """
+        self.capacity = capacity
+        self.scale = scale
+        self.max_bytes = max_bytes
+        self.output_dir = Path(output_dir)
+        self.max_archives = max_archives
+        self.max_total_bytes = max_total_bytes
+        self.max_age = max_age
+        self.name = name
+        self._entries = deque()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def record_frame(self, frame, **info):
+        """记录一帧画面，之后的事件都归到这一帧"""
+        if frame is None:
+            return
+        if self.scale != 1.0:
+            frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        else:
+            frame = frame.copy()
+        entry = {"frame": frame, "time": time.time(), "elapsed": time.monotonic() - self._started,
+                 "info": info, "events": []}
+        with self._lock:
+            self._entries.append(entry)
+            self._bytes += frame.nbytes
+            while self._entries and (len(self._entries) > self.capacity or self._bytes > self.max_bytes):
+                self._bytes -= self._entries.popleft()["frame"].nbytes
+
+    def record(self, kind, **data):
+        """记录一个事件（识别结果、点击等），附加到最近一帧"""
+        event = {"kind": kind, "elapsed": round(time.monotonic() - self._started, 3), **data}
+        with self._lock:
+            if self._entries:
+                self._entries[-1]["events"].append(event)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    @metrics.timed("flight_dump")
+    def dump(self, reason):
+        """
+        把缓冲区写入归档并清空缓冲区，缓冲区为空时不写入。
+
+        Returns:
+            归档文件路径，没有写入时返回None
+        """
+        with self._lock:
+            entries = list(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+        if not entries:
+            return None
+        timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
+        stem = "_".join(part for part in (timestamp, self.name, reason) if part)
+        archive_path = self.output_dir / f"{stem}.npz"
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            np.savez_compressed(archive_path, **{f"frame_{i:04d}": entry["frame"] for i, entry in enumerate(entries)})
+            sidecar = {
+                "reason": reason,
+                "name": self.name,
+                "scale": self.scale,
+                "frames": [{"key": f"frame_{i:04d}",
+                            "time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["time"])),
+                            "elapsed": round(entry["elapsed"], 3), **entry["info"], "events": entry["events"]}
+                           for i, entry in enumerate(entries)],
+            }
+            with open(archive_path.with_suffix(".json"), 'w', encoding='utf-8') as f:
+                json.dump(sidecar, f, ensure_ascii=False, indent=1, default=str)
+        except Exception as e:
+            logger.error(f"写入飞行记录失败：{e}", exc_info=True)
+            return None
+        logger.info(f"已保存最近{len(entries)}帧的飞行记录（{reason}）：{archive_path}")
+        self.prune()
+        return archive_path
+
+    def prune(self):
+        """按配额清理旧的归档"""
+        # 每个归档包含.npz和.json两个文件
+        prune_directory(self.output_dir, max_files=self.max_archives * 2, max_bytes=self.max_total_bytes,
+                        max_age=self.max_age, suffixes=(".npz", ".json"))
+        # 按大小清理时可能只删掉了归档的其中一个文件，清理剩下的说明文件
+        for sidecar in self.output_dir.glob("*.json"):
+            if not sidecar.with_suffix(".npz").exists():
+                sidecar.unlink(missing_ok=True)
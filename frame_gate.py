@@ -0,0 +1,73 @@
+import cv2
+import numpy as np
+
+
+class FrameChangeGate:
+    """
+    OCR前的画面变化检测。
+
+    将画面缩小为灰度缩略图作为签名，与上一次实际识别时的签名比较，
+    差异低于阈值时直接复用上次的识别结果。各区域按名称分别缓存。
+
+    缩略图按网格分块，取各分块平均灰度差的最大值作为差异：只占画面很小一部分的变化（如提示条）
+    在整幅画面的平均值中会被稀释到阈值以下，按分块比较时不会被漏掉。
+    """
+    def __init__(self, threshold=2.0, size=(64, 36), grid=(8, 6)):
+        """
+        Parameters:
+            threshold: 分块平均灰度差阈值（0-255），所有分块都低于该值时视为画面未变化
+            size: 缩略图尺寸(宽, 高)
+            grid: 分块数(列, 行)，缩略图尺寸不能整除时末尾的分块略大
+        """
+        self.threshold = threshold
+        self.size = size
+        self.grid = grid
+        self._signatures = {}
+        self._results = {}
+        self.executed = 0  # 实际执行的OCR次数
+        self.skipped = 0  # 因画面未变化跳过的OCR次数
+
+    def signature(self, image):
+        """计算画面签名：缩小后的灰度图"""
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        return cv2.resize(gray, self.size, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def compare(self, signature, previous):
+        """两个签名各分块平均灰度差的最大值，尺寸不同时返回None"""
+        if previous is None or previous.shape != signature.shape:
+            return None
+        diff = np.abs(signature - previous).astype(np.int32)
+        height, width = diff.shape[:2]
+        columns, rows = min(self.grid[0], width), min(self.grid[1], height)
+        ys = np.linspace(0, height, rows + 1).astype(int)
+        xs = np.linspace(0, width, columns + 1).astype(int)
+        # 先按行、再按列求和得到各分块的灰度差总和，除以分块面积得到分块平均值
+        sums = np.add.reduceat(np.add.reduceat(diff, ys[:-1], axis=0), xs[:-1], axis=1)
+        areas = np.outer(np.diff(ys), np.diff(xs))
+        return float((sums / areas).max())
+
+    def difference(self, key, signature):
+        """与该区域上次识别时签名的差异（分块平均灰度差的最大值），没有记录时返回None"""
+        return self.compare(signature, self._signatures.get(key))
+
+    def readtext(self, key, image, ocr_func):
+        """画面有变化时调用ocr_func识别，否则返回缓存的识别结果"""
+        signature = self.signature(image)
+        diff = self.difference(key, signature)
+        if diff is not None and diff < self.threshold:
+            self.skipped += 1
+            return self._results[key]
+        result = ocr_func(image)
+        self._signatures[key] = signature
+        self._results[key] = result
+        self.executed += 1
+        return result
+
+    def reset(self):
+        """清空所有缓存的签名和识别结果"""
+        self._signatures.clear()
+        self._results.clear()
+
+    def stats(self):
+        """返回执行和跳过的OCR次数"""
+        return {"executed": self.executed, "skipped": self.skipped}
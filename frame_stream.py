@@ -0,0 +1,175 @@
+import socket
+import subprocess
+import threading
+import time
+import cv2
+from logger_handler import logger
+
+
+class FrameStream:
+    """
+    基于`screenrecord --output-format=h264`的持续帧流。
+
+    保持一个长连接的`adb exec-out screenrecord`管道，后台线程用OpenCV解码H.264，
+    内存中始终保存最新一帧。OpenCV无法直接读取子进程的标准输出，
+    因此由转发线程把管道数据写入本地回环端口，再交给FFmpeg后端按tcp流解码。
+    """
+    def __init__(self, adb_cmd="adb", bit_rate=8000000, size=None, max_restarts=3):
+        """
+        Parameters:
+            adb_cmd: adb命令前缀，多设备时可传入"adb -s <serial>"
+            bit_rate: screenrecord的码率
+            size: 录制分辨率，如"1280x720"，默认使用设备原始分辨率
+            max_restarts: 管道异常退出后的最大重启次数，screenrecord单次最长录制180秒
+        """
+        self.adb_cmd = adb_cmd
+        self.bit_rate = bit_rate
+        self.size = size
+        self.max_restarts = max_restarts
+
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._proc = None
+        self._server = None
+        self._decode_thread = None
+
+        self._frame = None
+        self._frame_time = None
+        self._frame_consumed = True
+        self.frames = 0  # 已解码帧数
+        self.dropped_frames = 0  # 未被取走就被覆盖的帧数
+        self.restarts = 0
+        self.decode_lag = 0.0  # 数据到达至解码出帧的延迟滑动平均（秒）
+        self._last_chunk_time = None
+        self._fps_window = []
+
+    @property
+    def alive(self):
+        """帧流是否仍在工作"""
+        return self._decode_thread is not None and self._decode_thread.is_alive() and not self._stop_event.is_set()
+
+    def start(self):
+        """启动录屏管道和解码线程"""
+        if self.alive:
+            return
+        self._stop_event.clear()
+        self._decode_thread = threading.Thread(target=self._decode_loop, name="FrameStreamDecoder", daemon=True)
+        self._decode_thread.start()
+        logger.info("屏幕帧流已启动")
+
+    def stop(self):
+        """停止录屏管道和解码线程"""
+        self._stop_event.set()
+        self._close_pipe()
+        if self._decode_thread is not None:
+            self._decode_thread.join(timeout=5)
+            self._decode_thread = None
+        logger.info(f"屏幕帧流已停止：{self.stats()}")
+
+    def latest(self):
+        """返回最新一帧的副本，帧流不可用时返回None"""
+        with self._lock:
+            if self._frame is None or not self.alive:
+                return None
+            self._frame_consumed = True
+            return self._frame.copy()
+
+    def stats(self):
+        """返回帧流健康状态：帧率、解码延迟、丢帧数等"""
+        with self._lock:
+            now = time.monotonic()
+            window = [t for t in self._fps_window if now - t <= 1.0]
+            frame_age = None if self._frame_time is None else now - self._frame_time
+            return {
+                "alive": self.alive,
+                "fps": len(window),
+                "decode_lag": self.decode_lag,
+                "frame_age": frame_age,
+                "frames": self.frames,
+                "dropped_frames": self.dropped_frames,
+                "restarts": self.restarts,
+            }
+
+    def _build_cmd(self):
+        """拼接screenrecord命令"""
+        cmd = f"{self.adb_cmd} exec-out screenrecord --output-format=h264 --bit-rate {self.bit_rate}"
+        if self.size:
+            cmd += f" --size {self.size}"
+        return cmd + " -"
+
+    def _open_pipe(self):
+        """启动screenrecord子进程，并在本地回环端口上转发其输出"""
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.bind(("127.0.0.1", 0))
+        self._server.listen(1)
+        port = self._server.getsockname()[1]
+        # 不经过shell启动，kill时才能直接结束adb进程
+        self._proc = subprocess.Popen(self._build_cmd().split(), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        threading.Thread(target=self._relay, args=(self._proc, self._server), name="FrameStreamRelay",
+                         daemon=True).start()
+        return f"tcp://127.0.0.1:{port}"
+
+    def _close_pipe(self):
+        """结束子进程并关闭转发端口"""
+        proc, self._proc = self._proc, None
+        server, self._server = self._server, None
+        if proc is not None:
+            proc.kill()
+        if server is not None:
+            server.close()
+
+    def _relay(self, proc, server):
+        """把screenrecord的H.264输出转发给解码器"""
+        try:
+            conn, _ = server.accept()
+        except OSError:
+            return
+        with conn:
+            try:
+                while not self._stop_event.is_set():
+                    chunk = proc.stdout.read1(65536)
+                    if not chunk:
+                        break
+                    self._last_chunk_time = time.monotonic()
+                    conn.sendall(chunk)
+            except OSError:
+                pass
+
+    def _decode_loop(self):
+        """解码线程：持续读取帧，管道断开后按次数重启"""
+        while not self._stop_event.is_set():
+            url = self._open_pipe()
+            cap = cv2.VideoCapture(url, cv2.CAP_FFMPEG)
+            try:
+                while not self._stop_event.is_set():
+                    ok, frame = cap.read()
+                    if not ok:
+                        break
+                    self._publish(frame)
+            finally:
+                cap.release()
+                self._close_pipe()
+
+            if self._stop_event.is_set():
+                break
+            if self.restarts >= self.max_restarts:
+                logger.error("屏幕帧流多次中断，停止重启，回退到单帧截图")
+                break
+            self.restarts += 1
+            logger.warning(f"屏幕帧流中断，第{self.restarts}次重启")
+
+    def _publish(self, frame):
+        """保存最新帧并更新统计"""
+        now = time.monotonic()
+        with self._lock:
+            if not self._frame_consumed:
+                self.dropped_frames += 1
+            self._frame = frame
+            self._frame_time = now
+            self._frame_consumed = False
+            self.frames += 1
+            if self._last_chunk_time is not None:
+                self.decode_lag = 0.9 * self.decode_lag + 0.1 * max(0.0, now - self._last_chunk_time)
+            self._fps_window.append(now)
+            if len(self._fps_window) > 120:
+                del self._fps_window[:60]
@@ -0,0 +1,178 @@
+import base64
+import json
+import os
+import time
+from pathlib import Path
+import cv2
+import numpy as np
+from logger_handler import logger
+from metrics import metrics, safe_name
+
+project_path = Path(__file__).parent
+layout_path = project_path / 'out_files' / 'layout_cache'
+
+
+def _encode_patch(patch):
+    return base64.b64encode(cv2.imencode(".png", patch)[1].tobytes()).decode('ascii')
+
+
+def _decode_patch(data):
+    return cv2.imdecode(np.frombuffer(base64.b64decode(data), dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+
+
+class LayoutCache:
+    """
+    单台设备的界面布局缓存。
+
+    OCR或模板匹配命中规则时，把文本框按屏幕比例保存为锚点，同时保留该文本框的灰度图作为校验模板。
+    之后每帧先在各锚点附近做一次小范围模板匹配，元素仍在原位时直接按缓存位置点击，跳过OCR；
+    校验不通过时照常走OCR。OCR在其他位置找到同一元素时更新锚点，按缓存点击后画面没有变化时删除锚点，
+    下次由OCR重新校准。校验模板与分辨率相关，锚点按分辨率分别保存。
+    """
+    def __init__(self, device="default", path=None, threshold=0.9, margin=0.02, tolerance=0.01):
+        """
+        Parameters:
+            device: 设备标识，多设备时为序列号（或序列号加包名）
+            path: 缓存文件，默认为out_files/layout_cache/<设备标识>.json
+            threshold: 校验模板匹配的置信度阈值（TM_CCOEFF_NORMED）
+            margin: 校验时在锚点四周额外搜索的范围（屏幕比例），容忍元素的轻微偏移
+            tolerance: OCR找到的位置与锚点相差超过该比例时视为布局变化，更新锚点
+        """
+        self.device = device
+        self.path = path or layout_path / f"{safe_name(device)}.json"
+        self.threshold = threshold
+        self.margin = margin
+        self.tolerance = tolerance
+        self._layouts = {}  # 分辨率 -> 锚点名称 -> 锚点
+        self._patches = {}  # (分辨率, 锚点名称) -> 校验模板
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.load()
+
+    @staticmethod
+    def _resolution(frame):
+        height, width = frame.shape[:2]
+        return f"{width}x{height}"
+
+    @staticmethod
+    def _key(rule, pattern):
+        return f"{rule.name}:{pattern}"
+
+    def load(self):
+        """读取持久化的布局，文件损坏时忽略"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self._layouts = json.load(f).get("layouts", {})
+            for resolution, anchors in self._layouts.items():
+                for key, anchor in anchors.items():
+                    self._patches[(resolution, key)] = _decode_patch(anchor["patch"])
+        except (OSError, ValueError, KeyError, cv2.error) as e:
+            logger.warning(f"布局缓存文件无法读取，忽略：{e}")
+            self._layouts, self._patches = {}, {}
+            return
+        count = sum(len(anchors) for anchors in self._layouts.values())
+        logger.info(f"已加载布局缓存[{self.device}]{count}个锚点：{self.path}")
+
+    def save(self):
+        """把布局写入持久化文件"""
+        if not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"device": self.device, "layouts": self._layouts}, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.path)
+        self._dirty = False
+
+    def learn(self, frame, rule, pattern, text, bbox):
+        """记录规则命中的文本框，新锚点或位置发生变化时保存校验模板"""
+        height, width = frame.shape[:2]
+        resolution = self._resolution(frame)
+        x0, y0 = max(0, int(bbox[0][0])), max(0, int(bbox[0][1]))
+        x1, y1 = min(width, int(bbox[2][0])), min(height, int(bbox[2][1]))
+        if x1 - x0 < 4 or y1 - y0 < 4:
+            return
+        box = [x0 / width, y0 / height, x1 / width, y1 / height]
+        key = self._key(rule, pattern)
+        anchors = self._layouts.setdefault(resolution, {})
+        anchor = anchors.get(key)
+        if anchor is not None and max(abs(a - b) for a, b in zip(anchor["box"], box)) <= self.tolerance:
+            return
+        patch = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+        anchors[key] = {"rule": rule.name, "pattern": pattern, "text": text, "box": [round(v, 5) for v in box],
+                        "patch": _encode_patch(patch), "updated": time.strftime("%Y-%m-%d %H:%M:%S")}
+        self._patches[(resolution, key)] = patch
+        self._dirty = True
+        logger.info(f"布局{'变化，更新' if anchor is not None else '校准，记录'}锚点[{resolution}]{key}："
+                    f"({x0}, {y0})-({x1}, {y1})")
+
+    def _verify(self, frame, resolution, key, anchor):
+        """在锚点附近查找校验模板，返回屏幕坐标下的(文本框, 置信度)或None"""
+        patch = self._patches.get((resolution, key))
+        if patch is None:
+            return None
+        height, width = frame.shape[:2]
+        left, top, right, bottom = anchor["box"]
+        x0, y0 = max(0, int((left - self.margin) * width)), max(0, int((top - self.margin) * height))
+        x1, y1 = min(width, int((right + self.margin) * width)), min(height, int((bottom + self.margin) * height))
+        if x1 - x0 < patch.shape[1] or y1 - y0 < patch.shape[0]:
+            return None
+        window = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+        _, score, _, (x, y) = cv2.minMaxLoc(cv2.matchTemplate(window, patch, cv2.TM_CCOEFF_NORMED))
+        if not score >= self.threshold:  # 纯色区域的相关系数为NaN，同样视为不匹配
+            return None
+        x, y = x + x0, y + y0
+        t_height, t_width = patch.shape
+        return [[x, y], [x + t_width, y], [x + t_width, y + t_height], [x, y + t_height]], score
+
+    @metrics.timed("layout")
+    def find(self, frame, rules):
+        """
+        按规则优先级校验已缓存的锚点，返回第一个仍在原位的锚点或None。
+
+        Parameters:
+            frame: 当前画面
+            rules: 当前状态下生效的规则，按优先级排列
+        """
+        resolution = self._resolution(frame)
+        anchors = self._layouts.get(resolution)
+        if not anchors:
+            return None
+        for rule in rules:
+            for pattern in rule.patterns:
+                key = self._key(rule, pattern)
+                if key not in anchors:
+                    continue
+                anchor = anchors[key]
+                verified = self._verify(frame, resolution, key, anchor)
+                if verified is None:
+                    continue
+                bbox, score = verified
+                self.hits += 1
+                return {"key": key, "rule": rule, "pattern": pattern, "text": anchor["text"], "bbox": bbox,
+                        "score": score}
+        self.misses += 1
+        return None
+
+    def invalidate(self, frame, key):
+        """删除按缓存点击后没有生效的锚点"""
+        resolution = self._resolution(frame)
+        if self._layouts.get(resolution, {}).pop(key, None) is not None:
+            self._patches.pop((resolution, key), None)
+            self._dirty = True
+            self.invalidations += 1
+            logger.info(f"布局缓存锚点失效，已删除[{resolution}]{key}")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "anchors": sum(len(anchors) for anchors in self._layouts.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
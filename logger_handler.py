@@ -1,8 +1,12 @@
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import atexit
+import json
 import os
 import datetime
+import queue
 import sys
+import threading
 from pathlib import Path
 
 project_path = Path(__file__).parent
@@ -18,11 +22,91 @@ class LogFilter(logging.Filter):
         #     return False
         return True
 
+
+class DailyRotatingFileHandler(RotatingFileHandler):
+    """
+    按日期命名的日志文件处理器：每天写入新的日期文件，单个文件超过maxBytes时按大小轮转，
+    切换日期时删除超过保留天数的旧日志。
+    """
+    def __init__(self, log_dir, suffix=".log", maxBytes=10485760, backupCount=5, retention_days=30,
+                 encoding='utf-8'):
+        """
+        Parameters:
+            log_dir: 日志文件存放路径
+            suffix: 日志文件后缀
+            maxBytes: 单个文件的最大字节数
+            backupCount: 单日按大小轮转保留的备份文件数
+            retention_days: 日志保留天数，为None时不清理
+            encoding: 文件编码
+        """
+        self.log_dir = log_dir
+        self.suffix = suffix
+        self.retention_days = retention_days
+        self.current_date = datetime.date.today()
+        super().__init__(self._filename(self.current_date), maxBytes=maxBytes, backupCount=backupCount,
+                         encoding=encoding, delay=True)
+
+    def _filename(self, date):
+        return os.path.abspath(f"{self.log_dir}/{date.strftime('%Y-%m-%d')}{self.suffix}")
+
+    def shouldRollover(self, record):
+        if datetime.date.today() != self.current_date:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        today = datetime.date.today()
+        if today == self.current_date:
+            super().doRollover()
+            return
+        # 日期变化：切换到新日期的文件
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        self.current_date = today
+        self.baseFilename = self._filename(today)
+        self._remove_expired()
+
+    def _remove_expired(self):
+        """删除超过保留天数的日志文件"""
+        if self.retention_days is None:
+            return
+        cutoff = (self.current_date - datetime.timedelta(days=self.retention_days)).strftime('%Y-%m-%d')
+        for filename in os.listdir(self.log_dir):
+            if self.suffix in filename and filename[:10] < cutoff:
+                try:
+                    os.remove(os.path.join(self.log_dir, filename))
+                except OSError:
+                    pass
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行JSON，extra中的字段一并输出，便于指标采集程序解析"""
+    RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+    def format(self, record):
+        data = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        data.update({k: v for k, v in vars(record).items() if k not in self.RESERVED})
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
 class Logger:
     """
     Logger类用于封装日志功能，提供信息、调试、警告、错误和严重错误等不同级别的日志记录方法。
+
+    调用线程只把日志放入内存队列，由后台监听线程写入文件和控制台，不会阻塞在磁盘或控制台输出上。
+    同名的Logger只配置一次，重复创建不会叠加处理器。
     """
-    def __init__(self, name="自救针购买日志", level=logging.INFO, log_dir= log_path):
+    _listeners = {}
+    _lock = threading.Lock()
+
+    def __init__(self, name="自救针购买日志", level=logging.INFO, log_dir= log_path, console=True, json_output=False):
         """
         初始化Logger类实例。
 
@@ -30,34 +114,45 @@ class Logger:
             name: 日志记录器的名称，默认为"AppAutomation"。
             level: 日志级别，默认为logging.INFO。
             log_dir: 日志文件存放路径
+            console: 是否同时输出到控制台
+            json_output: 是否额外输出JSON格式的日志文件（同目录下的.jsonl文件）
         """
         self.logger = logging.getLogger(name)
-        self.logger.setLevel(level)  # 设置日志级别
-        self.logger.addFilter(LogFilter())  # 添加自定义日志过滤器
-
-        # 确保日志目录存在
-        if not os.path.exists(log_dir):
-            os.makedirs(log_dir)
-
-        # 创建包含日期的日志文件名
-        log_filename = f"{log_dir}/{datetime.datetime.now().strftime('%Y-%m-%d')}.log"
-
-        # 创建文件日志处理器，设置最大文件大小和备份文件数量，并指定编码为utf-8
-        self.file_handler = RotatingFileHandler(log_filename, maxBytes=10485760, backupCount=5, encoding='utf-8')
-        self.file_handler.setLevel(level)  # 设置文件处理器的日志级别
-
-        # 创建控制台日志处理器
-        self.console_handler = logging.StreamHandler(sys.stdout)
-        self.console_handler.setLevel(level)  # 设置控制台处理器的日志级别
-
-        # 设置日志格式
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(threadName)s - %(message)s')
-        self.file_handler.setFormatter(formatter)  # 为文件处理器设置格式
-        self.console_handler.setFormatter(formatter)  # 为控制台处理器设置格式
-
-        # 将处理器添加到日志记录器
-        self.logger.addHandler(self.file_handler)
-        self.logger.addHandler(self.console_handler)
+        with Logger._lock:
+            if name in Logger._listeners:
+                return
+            self.logger.setLevel(level)  # 设置日志级别
+            self.logger.addFilter(LogFilter())  # 添加自定义日志过滤器
+            self.logger.propagate = False
+
+            # 确保日志目录存在
+            if not os.path.exists(log_dir):
+                os.makedirs(log_dir)
+
+            # 文件日志处理器：按日期命名，每天切换文件，单个文件超过10MB时按大小轮转，编码为utf-8
+            handlers = [DailyRotatingFileHandler(log_dir)]
+            # 创建控制台日志处理器
+            if console:
+                handlers.append(logging.StreamHandler(sys.stdout))
+
+            # 设置日志格式
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(threadName)s - %(message)s')
+            for handler in handlers:
+                handler.setLevel(level)
+                handler.setFormatter(formatter)
+            if json_output:
+                json_handler = DailyRotatingFileHandler(log_dir, suffix=".jsonl")
+                json_handler.setLevel(level)
+                json_handler.setFormatter(JsonFormatter())
+                handlers.append(json_handler)
+
+            # 日志记录器只向无界队列投递，由监听线程统一写出
+            log_queue = queue.SimpleQueue()
+            self.logger.addHandler(QueueHandler(log_queue))
+            listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+            listener.start()
+            Logger._listeners[name] = listener
+            atexit.register(listener.stop)  # 退出前写完队列中剩余的日志
 
     def get_logger(self):
         return self.logger
@@ -77,12 +172,24 @@ class Logger:
     def warning(self, msg):
         self.logger.warning(msg)
 
-# 配置日志
-logger = Logger().get_logger()
+def flush_logs():
+    """
+    等待队列中的日志全部写出。
+
+    多进程的工作进程退出时不会执行atexit，进程结束前需要调用本函数，否则最后的日志可能丢失。
+    """
+    with Logger._lock:
+        for listener in Logger._listeners.values():
+            listener.stop()  # 写完队列中已有的日志后结束监听线程
+            listener.start()
+
+
+# 配置日志，设置环境变量YHTJ_LOG_JSON=1时额外输出JSON格式的日志
+logger = Logger(json_output=os.environ.get("YHTJ_LOG_JSON") == "1").get_logger()
 
 if __name__ == '__main__':
     logger.info("Hello, world!")
     logger.warning("This is a warning message.")
     logger.error("An error has occurred.")
     logger.debug("This is a debug message.")
-    logger.critical("A critical error has occurred.")
\ No newline at end of file
+    logger.critical("A critical error has occurred.")
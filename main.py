@@ -1,110 +1,147 @@
-import schedule
 import time
-from units7 import ScreenAutomation
-import os
-import shutil
+from units7 import ScreenAutomation, run_cmd
+from app_lifecycle import AppLifecycle
+from fleet import FleetRun, load_fleet, run_fleet
+from ocr_engine import configure_ocr_engine, get_ocr_engine
+from ocr_backends import allowlist_from_texts
+from rule_engine import get_rule_engine
+from scheduler import PrecisionScheduler
+from metrics import configure_metrics, metrics
 from logger_handler import logger
 
-# 定义一个函数来封装主逻辑，以便我们可以捕获异常并重新运行
-def run_main():
+WARM_MODE = False  # 为True时每小时运行结束后app只退到后台，下次直接切回前台，免去冷启动
+NETEASE_APP = AppLifecycle('com.netease.yhtj', warm=WARM_MODE)
+HUAWEI_APP = AppLifecycle('com.netease.yhtj.huawei', warm=WARM_MODE)
+
+# 统计adb、截图、识别、点击等各阶段耗时，每次运行结束后导出到out_files/metrics；PROFILE为True时同时用cProfile分析主循环
+METRICS_ENABLED = True
+PROFILE = False
+configure_metrics(enabled=METRICS_ENABLED, profile=PROFILE)
+
+# 每天的购买时间：原来每小时58分启动，启动和加载耗时约两分钟，整点开始购买
+PURCHASE_TIMES = [f"{hour + 1:02d}:00" for hour in range(18)]
+
+# OCR推理后端，改为"onnx"时使用ONNX Runtime（需额外安装onnxruntime），首次运行会导出并量化模型
+OCR_BACKEND = "easyocr"
+if OCR_BACKEND == "onnx":
+    configure_ocr_engine(backend="onnx", quantize=True, inter_op_threads=1,
+                         readtext_defaults={"canvas_size": 1280, "mag_ratio": 1.0,
+                                            "allowlist": allowlist_from_texts(get_rule_engine().all_patterns())})
+
+# 启动app并等待就绪，返回可直接运行主循环的ScreenAutomation
+def prepare_app():
+    start_app()
+    logger.info(f'{time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())}启动app')
+    automation = ScreenAutomation(layout_key=NETEASE_APP.stats_key)
+    if NETEASE_APP.wait_ready(automation) is None:
+        # 超时未就绪时关闭app，由调用方重试（预热阶段失败时到购买时间后重新启动）
+        automation.close()
+        stop_app()
+        raise RuntimeError("app启动后未就绪")
+    return automation
+
+# 定义一个函数来封装主逻辑，以便我们可以捕获异常并重新运行，automation为预热阶段已就绪的实例
+# 返回第一次点击的时间，用于统计与购买时间的偏差
+def run_main(automation=None):
+    configure_metrics(device=NETEASE_APP.stats_key)  # 两个app的耗时统计分别导出
     attempts = 1
     max_attempts = 2  # 最多重试两次
+    first_tap_at = None
     while attempts <= max_attempts:
         try:
-            start_app()
-            logger.info(f'{time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())}启动app')
-            time.sleep(30)
-            ScreenAutomation().run_main()
+            if automation is None:
+                automation = prepare_app()
+            try:
+                automation.run_main()
+            finally:
+                first_tap_at = first_tap_at or automation.first_tap_at
             logger.info(f'{time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())}app主代码执行完毕')
             stop_app()
             logger.info(f'{time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())}app关闭')
-            clean_screenshots()
-            logger.info('删除截图')
             break  # 如果没有错误，跳出循环
         except Exception as e:
             logger.error(f"运行过程中出现错误：{e}")
-            clean_screenshots()
+            automation = None
             attempts += 1
             if attempts > max_attempts:
                 logger.error("达到最大重试次数，停止运行")
+    metrics.flush(run="netease")
+    return first_tap_at
 
 # 定义一个函数来封装华为app的主逻辑
 def run_main_huawei():
+    configure_metrics(device=HUAWEI_APP.stats_key)
     attempts = 0
     max_attempts = 2  # 最多重试两次
     while attempts <= max_attempts:
         try:
             start_app_huawei()
             logger.info(f'{time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())}启动华为app')
-            time.sleep(15)
-            ScreenAutomation().run_main()
+            automation = ScreenAutomation(layout_key=HUAWEI_APP.stats_key)
+            if HUAWEI_APP.wait_ready(automation) is None:
+                automation.close()
+                stop_app_huawei()
+                raise RuntimeError("华为app启动后未就绪")
+            automation.run_main()
             logger.info(f'{time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())}华为app主代码执行完毕')
             stop_app_huawei()
             logger.info(f'{time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())}华为app关闭')
-            clean_screenshots()
-            logger.info('删除截图')
             break  # 如果没有错误，跳出循环
         except Exception as e:
             logger.info(f'{time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())}华为app运行过程中出现错误：{e}')
-            clean_screenshots()
             attempts += 1
             if attempts > max_attempts:
                 logger.error(f'{time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())}达到最大重试次数，停止运行')
+    metrics.flush(run="huawei")
 
 # 启动华为app
 def start_app_huawei():
-    cmd = 'adb shell am start -n com.netease.yhtj.huawei/com.netease.game.MessiahNativeActivity'
-    ScreenAutomation()._run_cmd(cmd)
-    time.sleep(3)
+    HUAWEI_APP.start()
 
 # 关闭华为app
 def stop_app_huawei():
-    cmd = 'adb shell am force-stop com.netease.yhtj.huawei'
-    ScreenAutomation()._run_cmd(cmd)
-    time.sleep(3)
+    HUAWEI_APP.stop()
 
 # 启动app
 def start_app():
-    cmd = 'adb shell am start -n com.netease.yhtj/com.netease.game.MessiahNativeActivity'
-    ScreenAutomation()._run_cmd(cmd)
-    time.sleep(3)
+    NETEASE_APP.start()
 
 # 关闭app
 def stop_app():
-    cmd = 'adb shell am force-stop com.netease.yhtj'
-    ScreenAutomation()._run_cmd(cmd)
-    time.sleep(3)
+    NETEASE_APP.stop()
 
-# 删除截图
-def clean_screenshot(folder_path="D:\\CODE\\YHTJ\\out_files\\screenshots"):
-    if os.path.exists(folder_path) and os.path.isdir(folder_path):
-        for filename in os.listdir(folder_path):
-            file_path = os.path.join(folder_path, filename)
-            try:
-                if os.path.isdir(file_path):
-                    shutil.rmtree(file_path)
-                else:
-                    os.remove(file_path)
-            except Exception as e:
-                logger.error(f'无法删除 {file_path}。原因: {e}')
-    else:
-        logger.error(f'提供的路径 {folder_path} 不存在或不是一个文件夹。')
+# 预热阶段：加载OCR模型、建立ADB连接、启动app并等待就绪，target为本次的购买时间
+def prewarm(target=None):
+    configure_metrics(device=NETEASE_APP.stats_key)  # 预热阶段的耗时计入网易版
+    devices = load_fleet()
+    if devices:
+        # 多设备时提前启动工作进程，各自加载模型、启动app并等待就绪，到购买时间才开始主循环
+        fleet = FleetRun(devices, start_at=target.timestamp() if target else None)
+        fleet.wait_ready()
+        return fleet
+    get_ocr_engine().warm_up()
+    run_cmd("adb shell true")
+    return prepare_app()
 
-def clean_screenshots():
-    clean_screenshot(folder_path="D:\\CODE\\YHTJ\\out_files\\screenshots")
-    time.sleep(1)
-    clean_screenshot(folder_path="D:\\CODE\\YHTJ\\out_files\\marked_screens")
-# 主函数，用于调度任务
-def main():
-    run_main()
+# 主函数，在购买时间触发，context为预热阶段已就绪的ScreenAutomation（多设备时为FleetRun）
+# 返回第一次点击的时间，由调度器统计与购买时间的偏差
+def main(context=None):
+    # 配置了fleet.yaml时各设备并行运行，否则按原方式依次运行网易版和华为版
+    devices = load_fleet()
+    if devices:
+        if isinstance(context, FleetRun):
+            results = context.results()
+        else:
+            logger.warning("多设备未经过预热，各设备将在购买时间内冷启动")
+            results = run_fleet(devices)
+        taps = [result["first_tap_at"] for result in results if result.get("first_tap_at")]
+        return min(taps) if taps else None
+    first_tap_at = run_main(context)
     time.sleep(5)
     run_main_huawei()
+    return first_tap_at
 
-# 安排任务
-for hour in range(18):  # 0到20点
-    schedule.every().day.at(f"{hour:02d}:58").do(main)
-
-while True:
-    schedule.run_pending()
-    
-    time.sleep(1)
\ No newline at end of file
+# 多进程在Windows上以spawn方式启动，子进程会重新导入主模块，调度循环只能在主进程中运行
+if __name__ == '__main__':
+    # 每个购买时间之前按历史耗时提前预热，到点后立即开始点击
+    PrecisionScheduler(PURCHASE_TIMES, prewarm, main).run_forever()
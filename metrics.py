@@ -0,0 +1,276 @@
+import cProfile
+import functools
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from logger_handler import logger
+
+project_path = Path(__file__).parent
+metrics_path = project_path / 'out_files' / 'metrics'
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10)  # 动作延迟直方图的分桶上限（秒）
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # 阶段耗时的分桶上限（秒）
+
+
+def safe_name(name):
+    """设备标识（如127.0.0.1:5555）转换为可用作文件名的字符串"""
+    return re.sub(r'[^\w.-]', '_', name)
+
+
+class LatencyHistogram:
+    """按固定分桶统计的延迟直方图"""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        """记录一次耗时"""
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """按分桶估算分位数，返回所在分桶的上限（不超过最大值）"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        """返回直方图的文本摘要"""
+        labels = [f"≤{bound}s" for bound in self.buckets] + [f">{self.buckets[-1]}s"]
+        buckets = ", ".join(f"{label}:{count}" for label, count in zip(labels, self.counts) if count)
+        mean = self.total / self.count if self.count else 0.0
+        return f"次数{self.count}，平均{mean:.2f}秒，最大{self.max:.2f}秒，分布[{buckets}]"
+
+
+class _NullSpan:
+    """关闭统计时使用的空计时器"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, metrics, stage, device):
+        self.metrics = metrics
+        self.stage = stage
+        self.device = device
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start, self.device)
+        return False
+
+
+class Metrics:
+    """
+    热路径耗时统计。
+
+    用span()包住需要统计的阶段，按阶段和设备汇总为直方图（p50/p95/最大值），
+    运行结束时导出为JSON Lines和Prometheus文本文件。关闭时span()直接返回空计时器，几乎没有开销。
+    JSON Lines记录每次运行的统计；Prometheus文本文件中的直方图是各设备跨运行、跨进程的累计值。
+    """
+    def __init__(self, enabled=False, device="default", output_dir=metrics_path, profile=False):
+        """
+        Parameters:
+            enabled: 是否统计
+            device: 默认的设备标签，多设备时每个工作进程设置为各自的设备名
+            output_dir: 导出目录
+            profile: 是否在profile()包住的运行中启用cProfile
+        """
+        self.enabled = enabled
+        self.device = device
+        self.output_dir = Path(output_dir)
+        self.profile_enabled = profile
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def span(self, stage, device=None):
+        """统计一个阶段的耗时：with metrics.span("ocr"): ..."""
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, stage, device or self.device)
+
+    def timed(self, stage):
+        """装饰器形式的span"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self.span(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def observe(self, stage, seconds, device=None):
+        """记录一次耗时"""
+        key = (stage, device or self.device)
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = LatencyHistogram(STAGE_BUCKETS)
+            self._histograms[key].observe(seconds)
+
+    def summary(self):
+        """各阶段、各设备的次数、总耗时、p50、p95和最大值"""
+        with self._lock:
+            return [{"stage": stage, "device": device, "count": h.count, "sum": round(h.total, 6),
+                     "p50": round(h.quantile(0.5), 6), "p95": round(h.quantile(0.95), 6), "max": round(h.max, 6)}
+                    for (stage, device), h in sorted(self._histograms.items())]
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def log_summary(self):
+        for item in self.summary():
+            logger.info(f"阶段耗时[{item['device']}/{item['stage']}]：次数{item['count']}，"
+                        f"p50 {item['p50'] * 1000:.0f}毫秒，p95 {item['p95'] * 1000:.0f}毫秒，"
+                        f"最大{item['max'] * 1000:.0f}毫秒")
+
+    def _totals_path(self):
+        return self.output_dir / f"yhtj_{safe_name(self.device)}.totals.json"
+
+    def _accumulate(self):
+        """
+        把本次运行的统计累加到该设备的累计值并保存，返回累计的直方图。
+
+        Prometheus的直方图是计数器，导出累计值才能保证_count和_bucket在多次运行（以及进程重启）之间单调递增。
+        """
+        path = self._totals_path()
+        totals = {}
+        if path.exists():
+            try:
+                with open(path, encoding='utf-8') as f:
+                    items = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"累计耗时统计无法读取，重新开始累计：{e}")
+                items = []
+            for item in items:
+                if tuple(item["buckets"]) != STAGE_BUCKETS:
+                    continue  # 分桶已修改，旧的累计值无法合并
+                h = LatencyHistogram(STAGE_BUCKETS)
+                h.counts, h.count, h.total, h.max = item["counts"], item["count"], item["sum"], item["max"]
+                totals[(item["stage"], item["device"])] = h
+        with self._lock:
+            for key, h in self._histograms.items():
+                total = totals.setdefault(key, LatencyHistogram(STAGE_BUCKETS))
+                total.counts = [a + b for a, b in zip(total.counts, h.counts)]
+                total.count += h.count
+                total.total += h.total
+                total.max = max(total.max, h.max)
+        temp_path = path.with_suffix(".json.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump([{"stage": stage, "device": device, "buckets": list(h.buckets), "counts": h.counts,
+                        "count": h.count, "sum": h.total, "max": h.max}
+                       for (stage, device), h in sorted(totals.items())], f, ensure_ascii=False)
+        os.replace(temp_path, path)
+        return totals
+
+    def _prometheus(self, totals):
+        """按Prometheus文本格式输出累计直方图，以及本次运行各阶段的最大耗时"""
+        lines = ["# HELP yhtj_stage_seconds 自动化各阶段耗时", "# TYPE yhtj_stage_seconds histogram"]
+        maxima = ["# HELP yhtj_stage_max_seconds 最近一次运行各阶段最大耗时", "# TYPE yhtj_stage_max_seconds gauge"]
+        for (stage, device), h in sorted(totals.items()):
+            labels = f'stage="{stage}",device="{device}"'
+            cumulative = 0
+            for bound, count in zip(h.buckets, h.counts):
+                cumulative += count
+                lines.append(f'yhtj_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'yhtj_stage_seconds_bucket{{{labels},le="+Inf"}} {h.count}')
+            lines.append(f'yhtj_stage_seconds_sum{{{labels}}} {h.total:.6f}')
+            lines.append(f'yhtj_stage_seconds_count{{{labels}}} {h.count}')
+        with self._lock:
+            for (stage, device), h in sorted(self._histograms.items()):
+                maxima.append(f'yhtj_stage_max_seconds{{stage="{stage}",device="{device}"}} {h.max:.6f}')
+        return "\n".join(lines + maxima) + "\n"
+
+    def export(self, run=None):
+        """
+        导出统计结果：追加到metrics.jsonl，累加到该设备的累计值，
+        并覆盖写入该设备的Prometheus文本文件（供node_exporter采集）。
+        """
+        if not self.enabled or not self._histograms:
+            return
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+            with open(self.output_dir / 'metrics.jsonl', 'a', encoding='utf-8') as f:
+                for item in self.summary():
+                    f.write(json.dumps({"time": timestamp, "run": run, **item}, ensure_ascii=False) + "\n")
+            prom_path = self.output_dir / f"yhtj_{safe_name(self.device)}.prom"
+            temp_path = prom_path.with_suffix(".prom.tmp")
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(self._prometheus(self._accumulate()))
+            os.replace(temp_path, prom_path)
+        except Exception as e:
+            logger.error(f"导出耗时统计失败：{e}", exc_info=True)
+
+    def flush(self, run=None):
+        """一次运行结束时输出摘要、导出并清空统计"""
+        if not self.enabled:
+            return
+        self.log_summary()
+        self.export(run)
+        self.reset()
+
+    @contextmanager
+    def profile(self, name):
+        """
+        在启用profile时用cProfile分析包住的代码，结果保存为.prof文件（可用snakeviz等工具查看）。
+
+        未启用时不做任何事；需要用py-spy采样时不必启用，日志中会输出进程号。
+        """
+        if not self.profile_enabled:
+            yield
+            return
+        logger.info(f"性能分析已启用（{name}），进程号{os.getpid()}，也可用 py-spy record -p {os.getpid()} 采样")
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profile_dir = self.output_dir / 'profiles'
+            profile_dir.mkdir(parents=True, exist_ok=True)
+            path = profile_dir / f"{time.strftime('%Y-%m-%d_%H-%M-%S')}_{safe_name(self.device)}_{name}.prof"
+            profiler.dump_stats(str(path))
+            logger.info(f"性能分析结果已保存：{path}")
+
+
+# 进程内共享的统计实例，设置环境变量YHTJ_METRICS=1开启统计，YHTJ_PROFILE=1对每次运行启用cProfile
+metrics = Metrics(enabled=os.environ.get("YHTJ_METRICS") == "1", profile=os.environ.get("YHTJ_PROFILE") == "1")
+
+
+def configure_metrics(enabled=None, device=None, profile=None):
+    """修改进程内统计实例的配置"""
+    if enabled is not None:
+        metrics.enabled = enabled
+    if device is not None:
+        metrics.device = device
+    if profile is not None:
+        metrics.profile_enabled = profile
+    return metrics
@@ -0,0 +1,143 @@
+import os
+from pathlib import Path
+from logger_handler import logger
+
+project_path = Path(__file__).parent
+onnx_model_dir = project_path / 'models' / 'onnx'
+
+
+class EasyOcrBackend:
+    """默认后端：直接使用easyocr.Reader的PyTorch模型"""
+    name = "easyocr"
+
+    def __init__(self, lang_list, **reader_kwargs):
+        self.lang_list = lang_list
+        self.reader_kwargs = reader_kwargs
+
+    def load(self):
+        """创建并返回easyocr.Reader"""
+        import easyocr
+        return easyocr.Reader(self.lang_list, **self.reader_kwargs)
+
+
+class OnnxModule:
+    """用onnxruntime会话替换easyocr中的PyTorch模型，输入输出仍为torch张量"""
+    def __init__(self, session, path):
+        self.session = session
+        self.input_name = session.get_inputs()[0].name
+        self.nbytes = os.path.getsize(path)
+
+    def eval(self):
+        return self
+
+    def __call__(self, image, *unused):
+        # 识别模型的第二个参数text_for_pred在CTC解码中不参与计算
+        import torch
+        outputs = self.session.run(None, {self.input_name: image.cpu().numpy()})
+        tensors = tuple(torch.from_numpy(output) for output in outputs)
+        return tensors if len(tensors) > 1 else tensors[0]
+
+
+class OnnxOcrBackend(EasyOcrBackend):
+    """
+    ONNX Runtime后端。
+
+    首次加载时把easyocr的CRAFT检测模型和CRNN识别模型导出为ONNX（可选int8动态量化），
+    之后直接读取导出的模型，用onnxruntime推理；前后处理仍沿用easyocr，识别结果与原实现一致。
+    """
+    name = "onnx"
+
+    def __init__(self, lang_list, model_dir=onnx_model_dir, quantize=True, intra_op_threads=None,
+                 inter_op_threads=1, **reader_kwargs):
+        """
+        Parameters:
+            lang_list: 识别语言列表
+            model_dir: ONNX模型缓存目录
+            quantize: 是否对导出的模型做int8动态量化
+            intra_op_threads: 单个算子内的并行线程数，默认由onnxruntime决定
+            inter_op_threads: 算子间的并行线程数
+            reader_kwargs: 透传给easyocr.Reader的其他参数
+        """
+        super().__init__(lang_list, **reader_kwargs)
+        self.model_dir = Path(model_dir)
+        self.quantize = quantize
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+
+    def _model_path(self, name):
+        suffix = "_int8" if self.quantize else ""
+        return self.model_dir / f"{name}_{'_'.join(self.lang_list)}{suffix}.onnx"
+
+    def _export(self, model, dummy, path, input_name, output_names, dynamic_axes):
+        """导出ONNX模型，需要时再做int8量化"""
+        import torch
+        self.model_dir.mkdir(parents=True, exist_ok=True)
+        float_path = path.with_name(path.stem.replace("_int8", "") + "_fp32.onnx") if self.quantize else path
+        with torch.no_grad():
+            torch.onnx.export(model, dummy, str(float_path), input_names=[input_name], output_names=output_names,
+                              dynamic_axes=dynamic_axes, opset_version=17)
+        if self.quantize:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(str(float_path), str(path), weight_type=QuantType.QInt8)
+            os.remove(float_path)
+        logger.info(f"已导出ONNX模型：{path}")
+
+    def _export_models(self, reader):
+        """把reader中的PyTorch模型导出为ONNX"""
+        import torch
+
+        class _Recognizer(torch.nn.Module):
+            """去掉CTC模型中不使用的text参数，便于导出"""
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+
+            def forward(self, image):
+                return self.model(image, None)
+
+        detector_path, recognizer_path = self._model_path("craft"), self._model_path("crnn")
+        if not detector_path.exists():
+            self._export(reader.detector, torch.randn(1, 3, 640, 640), detector_path, "image", ["y", "feature"],
+                         {"image": {0: "batch", 2: "height", 3: "width"},
+                          "y": {0: "batch", 1: "height", 2: "width"},
+                          "feature": {0: "batch", 2: "height", 3: "width"}})
+        if not recognizer_path.exists():
+            self._export(_Recognizer(reader.recognizer).eval(), torch.randn(1, 1, 64, 256), recognizer_path, "image",
+                         ["preds"], {"image": {0: "batch", 3: "width"}, "preds": {0: "batch", 1: "length"}})
+        return detector_path, recognizer_path
+
+    def _session(self, path):
+        """按线程配置创建推理会话"""
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.intra_op_threads:
+            options.intra_op_num_threads = self.intra_op_threads
+        if self.inter_op_threads:
+            options.inter_op_num_threads = self.inter_op_threads
+        return OnnxModule(ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"]), path)
+
+    def load(self):
+        """创建easyocr.Reader，并把检测和识别模型替换为onnxruntime会话"""
+        import easyocr
+        # 导出需要浮点模型，关闭easyocr自带的PyTorch动态量化
+        reader = easyocr.Reader(self.lang_list, gpu=False, quantize=False, **self.reader_kwargs)
+        detector_path, recognizer_path = self._export_models(reader)
+        reader.detector = self._session(detector_path)
+        reader.recognizer = self._session(recognizer_path)
+        return reader
+
+
+BACKENDS = {backend.name: backend for backend in (EasyOcrBackend, OnnxOcrBackend)}
+
+
+def create_backend(name, lang_list, **options):
+    """按名称创建OCR后端"""
+    if name not in BACKENDS:
+        raise ValueError(f"未知的OCR后端：{name}，可选：{', '.join(BACKENDS)}")
+    return BACKENDS[name](lang_list, **options)
+
+
+def allowlist_from_texts(texts, extra="0123456789:：,，. "):
+    """由目标文本生成识别字符白名单，识别器只在这些字符中选择"""
+    return "".join(sorted(set("".join(texts)) | set(extra)))
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from logger_handler import logger
+
+try:
+    import xxhash
+except ImportError:  # 未安装xxhash时退回标准库的blake2b
+    xxhash = None
+
+# readtext参数中属于检测阶段和识别阶段的部分，其余参数（paragraph、rotation_info等）不走缓存
+DETECT_OPTIONS = {"min_size", "text_threshold", "low_text", "link_threshold", "canvas_size", "mag_ratio",
+                  "slope_ths", "ycenter_ths", "height_ths", "width_ths", "add_margin", "threshold",
+                  "bbox_min_score", "bbox_min_size", "max_candidates"}
+RECOGNIZE_OPTIONS = {"decoder", "beamWidth", "batch_size", "workers", "allowlist", "blocklist",
+                     "contrast_ths", "adjust_contrast", "filter_ths"}
+IGNORED_OPTIONS = {"y_ths", "x_ths"}  # 只在paragraph=True时生效
+
+
+def content_hash(*parts):
+    """计算内容哈希，优先使用xxhash"""
+    hasher = xxhash.xxh3_128() if xxhash is not None else hashlib.blake2b(digest_size=16)
+    for part in parts:
+        hasher.update(part if isinstance(part, bytes) else memoryview(part))
+    return hasher.hexdigest()
+
+
+class RecognitionCache:
+    """
+    文本框识别结果缓存。
+
+    easyocr的识别分为检测和识别两步，本缓存保留检测，按每个文本框送入识别模型的灰度图内容计算哈希，
+    相同内容的文本框直接复用上次的识别文本和置信度，跳过识别模型。
+    CPU上easyocr逐个文本框识别，单个文本框的结果与其他文本框无关，因此命中缓存不会改变识别结果。
+    """
+    def __init__(self, max_entries=2048, path=None, namespace=""):
+        """
+        Parameters:
+            max_entries: 最多缓存的文本框数，超出后淘汰最久未使用的条目
+            path: 持久化文件路径，为None时只在内存中缓存
+            namespace: 缓存键前缀，不同模型或语言的识别结果互不复用
+        """
+        self.max_entries = max_entries
+        self.path = path
+        self.namespace = namespace
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.recognize_time = 0.0  # 未命中时识别模型的总耗时，用于估算节省的时间
+        self.fallbacks = 0  # 参数不支持缓存、直接调用readtext的次数
+        if path:
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    def _key(self, patch, options):
+        return content_hash(f"{self.namespace}|{patch.shape}|{options}".encode(), patch.tobytes())
+
+    def readtext(self, reader, image, **kwargs):
+        """与reader.readtext参数和结果一致，识别阶段按文本框复用缓存"""
+        from easyocr.utils import four_point_transform, reformat_input
+        import numpy as np
+
+        unsupported = set(kwargs) - DETECT_OPTIONS - RECOGNIZE_OPTIONS - IGNORED_OPTIONS
+        batched = kwargs.get("batch_size", 1) != 1 and reader.device != 'cpu'
+        if unsupported or batched:
+            self.fallbacks += 1
+            return reader.readtext(image, **kwargs)
+
+        detect_options = {k: v for k, v in kwargs.items() if k in DETECT_OPTIONS}
+        recognize_options = {k: v for k, v in kwargs.items() if k in RECOGNIZE_OPTIONS}
+        options = repr(sorted(recognize_options.items()))
+        img, img_cv_grey = reformat_input(image)
+        horizontal_list, free_list = reader.detect(img, reformat=False, **detect_options)
+        height, width = img_cv_grey.shape
+
+        result = []
+        # 与easyocr.Reader.recognize在CPU上的处理顺序一致：先水平文本框，再倾斜文本框
+        for box in horizontal_list[0]:
+            x_min, x_max = max(0, box[0]), min(box[1], width)
+            y_min, y_max = max(0, box[2]), min(box[3], height)
+            patch = np.ascontiguousarray(img_cv_grey[y_min:y_max, x_min:x_max])
+            screen_box = [[x_min, y_min], [x_max, y_min], [x_max, y_max], [x_min, y_max]]
+            result += self._recognize(reader, img_cv_grey, patch, options, recognize_options, screen_box,
+                                      horizontal_list=[box], free_list=[])
+        for box in free_list[0]:
+            patch = np.ascontiguousarray(four_point_transform(img_cv_grey, np.array(box, dtype="float32")))
+            result += self._recognize(reader, img_cv_grey, patch, options, recognize_options, box,
+                                      horizontal_list=[], free_list=[box])
+        return result
+
+    def _recognize(self, reader, img_cv_grey, patch, options, recognize_options, box, **boxes):
+        """识别单个文本框，命中缓存时按当前坐标还原结果"""
+        key = self._key(patch, options)
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            return [(box, text, confidence) for text, confidence in cached]
+        start = time.perf_counter()
+        result = reader.recognize(img_cv_grey, reformat=False, **boxes, **recognize_options)
+        self.recognize_time += time.perf_counter() - start
+        self.misses += 1
+        self.put(key, [(text, confidence) for _, text, confidence in result])
+        return result
+
+    def load(self):
+        """读取持久化的缓存，文件损坏时忽略"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"OCR识别缓存文件无法读取，忽略：{e}")
+            return
+        for key, value in data.get("entries", [])[-self.max_entries:]:
+            self._entries[key] = [tuple(item) for item in value]
+        logger.info(f"已加载OCR识别缓存{len(self._entries)}条：{self.path}")
+
+    def save(self):
+        """把缓存写入持久化文件，按最近使用顺序保存"""
+        if not self.path or not self._dirty:
+            return
+        with self._lock:
+            entries = [[key, [[text, float(confidence)] for text, confidence in value]]
+                       for key, value in self._entries.items()]
+            self._dirty = False
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"  # 多进程写同一文件时各自使用临时文件，互不覆盖
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"entries": entries}, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+    def stats(self):
+        """返回命中率和估算节省的识别时间"""
+        lookups = self.hits + self.misses
+        per_box = self.recognize_time / self.misses if self.misses else 0.0
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "time_saved": self.hits * per_box,
+            "fallbacks": self.fallbacks,
+        }
@@ -0,0 +1,183 @@
+import threading
+import time
+from pathlib import Path
+from logger_handler import logger
+from ocr_backends import create_backend
+from ocr_cache import RecognitionCache
+from metrics import metrics
+
+SERVICE_BUSY_TIMEOUT = 2  # OCR服务繁忙时最多等待多久（秒），超时后改为本地识别
+cache_path = Path(__file__).parent / 'out_files' / 'ocr_cache.json'
+
+
+class OcrEngine:
+    """
+    进程内共享的OCR引擎，封装easyocr.Reader，推理后端可选（见ocr_backends.BACKENDS）。
+
+    模型在第一次真正识别时才加载，之后所有ScreenAutomation实例共用同一份模型，
+    仅调用ADB辅助方法的实例不会触发模型加载。
+    本机运行着常驻OCR服务（ocr_service.py）时，识别请求直接发给服务，本进程不再加载模型。
+    是否有服务只在首次识别或warm_up()时探测，识别过程中不会再尝试连接（连接未监听的端口在Windows上需要1~2秒）。
+    """
+    def __init__(self, lang_list=None, backend="easyocr", readtext_defaults=None, cache_size=2048,
+                 cache_path=cache_path, **backend_options):
+        """
+        Parameters:
+            lang_list: 识别语言列表，默认为['ch_sim']
+            backend: 推理后端名称，"easyocr"或"onnx"
+            readtext_defaults: 每次识别默认附加的参数，如canvas_size、mag_ratio、allowlist
+            cache_size: 文本框识别结果缓存的条目数，为0时不使用缓存
+            cache_path: 识别缓存的持久化文件，为None时只在内存中缓存
+            backend_options: 透传给后端的参数（如onnx后端的quantize、intra_op_threads）
+        """
+        self.lang_list = lang_list or ['ch_sim']
+        self.backend = backend
+        self.backend_options = backend_options
+        self.readtext_defaults = readtext_defaults or {}
+        self._reader = None
+        self._lock = threading.Lock()
+        self.num_threads = None  # 推理线程数，多设备并行时限制每个进程的线程数，避免CPU超额订阅
+        self.load_time = None  # 模型加载耗时（秒）
+        self.memory_footprint = None  # 模型权重占用内存（字节）
+        self.use_service = True  # 是否优先使用常驻OCR服务，服务进程自身需关闭
+        self._client = None
+        self._service_checked = False
+        self.cache = RecognitionCache(cache_size, str(cache_path) if cache_path else None,
+                                      namespace=f"{backend}|{'+'.join(self.lang_list)}") if cache_size else None
+
+    @property
+    def loaded(self):
+        """模型是否已加载"""
+        return self._reader is not None
+
+    @property
+    def reader(self):
+        """获取easyocr.Reader，首次访问时加载模型"""
+        if self._reader is None:
+            with self._lock:
+                if self._reader is None:
+                    self._load()
+        return self._reader
+
+    def _load(self):
+        """加载检测和识别模型，并记录耗时与内存占用"""
+        start = time.perf_counter()
+        options = dict(self.backend_options)
+        if self.num_threads:
+            import torch  # 延迟导入，torch的导入本身就需要数秒
+            torch.set_num_threads(self.num_threads)
+            if self.backend == "onnx":
+                options.setdefault("intra_op_threads", self.num_threads)
+        reader = create_backend(self.backend, self.lang_list, **options).load()
+        self.load_time = time.perf_counter() - start
+        self.memory_footprint = self._model_bytes(reader)
+        logger.info(f"OCR模型加载完成（{self.backend}后端），耗时{self.load_time:.2f}秒，"
+                    f"模型占用内存{self.memory_footprint / 1024 / 1024:.1f}MB")
+        self._reader = reader
+
+    @staticmethod
+    def _model_bytes(reader):
+        """统计检测器和识别器的参数及缓冲区占用的字节数"""
+        total = 0
+        for model in (getattr(reader, 'detector', None), getattr(reader, 'recognizer', None)):
+            if hasattr(model, 'nbytes'):
+                total += model.nbytes  # onnx后端按模型文件大小统计
+                continue
+            if model is None or not hasattr(model, 'parameters'):
+                continue
+            for tensor in list(model.parameters()) + list(model.buffers()):
+                total += tensor.numel() * tensor.element_size()
+        return total
+
+    def _service(self, probe=False):
+        """获取常驻OCR服务的客户端，服务未运行时返回None；probe为True时重新探测服务"""
+        if not self.use_service:
+            return None
+        if self._client is not None:
+            return self._client
+        if self._service_checked and not probe:
+            return None
+        self._service_checked = True
+        from ocr_service import connect
+        self._client = connect()
+        if self._client is not None:
+            self._client.busy_timeout = SERVICE_BUSY_TIMEOUT
+            logger.info("检测到常驻OCR服务，识别请求将发送到服务")
+        return self._client
+
+    def _drop_service(self):
+        if self._client is not None:
+            try:
+                self._client.close()
+            except OSError:
+                pass
+            self._client = None
+
+    def warm_up(self):
+        """探测OCR服务（每次预热时重新探测），服务未运行时加载本地模型"""
+        if self._service(probe=True) is None:
+            _ = self.reader
+
+    @metrics.timed("ocr")
+    def readtext(self, image, **kwargs):
+        """识别图像中的文本，参数与easyocr.Reader.readtext一致"""
+        kwargs = {**self.readtext_defaults, **kwargs}
+        client = self._service() if hasattr(image, 'shape') else None
+        if client is not None:
+            from ocr_service import ServiceBusy
+            try:
+                return client.readtext(image, **kwargs)
+            except ServiceBusy:
+                logger.warning(f"OCR服务繁忙（超过{SERVICE_BUSY_TIMEOUT}秒），本次改为本地识别")
+            except (OSError, EOFError) as e:
+                logger.warning(f"OCR服务连接断开，改为本地识别：{e}")
+                self._client = None
+            except RuntimeError as e:
+                logger.warning(f"OCR服务识别失败，改为本地识别：{e}")
+                self._drop_service()
+        if self.cache is not None:
+            return self.cache.readtext(self.reader, image, **kwargs)
+        return self.reader.readtext(image, **kwargs)
+
+    def save_cache(self):
+        """持久化识别缓存，下次运行时复用"""
+        if self.cache is not None:
+            try:
+                self.cache.save()
+            except OSError as e:
+                logger.warning(f"保存OCR识别缓存失败：{e}")
+
+    def stats(self):
+        """返回模型加载状态、耗时和内存占用"""
+        return {
+            "backend": self.backend,
+            "service": self._client is not None,
+            "loaded": self.loaded,
+            "load_time": self.load_time,
+            "memory_footprint": self.memory_footprint,
+            "cache": self.cache.stats() if self.cache is not None else None,
+        }
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_ocr_engine():
+    """获取进程内唯一的OCR引擎实例"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = OcrEngine()
+    return _engine
+
+
+def configure_ocr_engine(**options):
+    """在首次识别前替换进程内的OCR引擎配置，参数同OcrEngine"""
+    global _engine
+    with _engine_lock:
+        if _engine is not None and _engine.loaded:
+            raise RuntimeError("OCR模型已加载，无法修改配置")
+        _engine = OcrEngine(**options)
+    return _engine
@@ -0,0 +1,215 @@
+import queue
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+from logger_handler import logger
+
+DEFAULT_ADDRESS = ("127.0.0.1", 50555)
+AUTHKEY = b"yhtj-ocr"
+
+
+class ServiceBusy(Exception):
+    """OCR服务队列已满"""
+
+
+class _Request:
+    """一次识别请求，由连接线程提交、批处理线程填充结果"""
+    def __init__(self, image, kwargs):
+        self.image = image
+        self.kwargs = kwargs
+        self.submitted = time.monotonic()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    @property
+    def batch_key(self):
+        """尺寸和参数都相同的请求才能合并为一次批量识别"""
+        return self.image.shape, repr(sorted(self.kwargs.items()))
+
+
+class OcrService:
+    """
+    常驻的本地OCR服务。
+
+    只加载一份easyocr模型，多个设备进程通过本地套接字提交画面或裁剪图。
+    在batch_window秒内到达的同尺寸请求合并为一次readtext_batched调用，
+    队列有上限，满了直接返回忙碌，由客户端退避重试。
+    """
+    def __init__(self, address=DEFAULT_ADDRESS, max_queue=16, batch_window=0.02, max_batch=8):
+        """
+        Parameters:
+            address: 监听地址
+            max_queue: 等待识别的请求上限
+            batch_window: 合并请求的等待窗口（秒）
+            max_batch: 单批最多合并的请求数
+        """
+        from ocr_engine import get_ocr_engine
+
+        self.address = address
+        self.engine = get_ocr_engine()
+        self.engine.use_service = False  # 服务自身在本进程内识别
+        self.requests = queue.Queue(maxsize=max_queue)
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._stats_lock = threading.Lock()
+        self._started = time.monotonic()
+        self.completed = 0
+        self.rejected = 0
+        self.batches = 0
+        self.total_wait = 0.0
+        self.total_latency = 0.0
+
+    def serve_forever(self):
+        """加载模型并开始监听"""
+        _ = self.engine.reader  # 启动时即加载模型，避免第一个请求承担加载耗时
+        threading.Thread(target=self._batch_loop, name="OcrBatch", daemon=True).start()
+        with Listener(self.address, authkey=AUTHKEY) as listener:
+            logger.info(f"OCR服务已启动，监听{self.address[0]}:{self.address[1]}")
+            while True:
+                conn = listener.accept()
+                threading.Thread(target=self._handle, args=(conn,), name="OcrConn", daemon=True).start()
+
+    def _handle(self, conn):
+        """处理单个客户端连接上的请求"""
+        with conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+                command = message[0]
+                if command == "ping":
+                    conn.send(("ok", None))
+                elif command == "stats":
+                    conn.send(("ok", self.stats()))
+                elif command == "readtext":
+                    conn.send(self._submit(message[1], message[2]))
+                else:
+                    conn.send(("error", f"未知命令：{command}"))
+
+    def _submit(self, image, kwargs):
+        """把请求放入队列并等待批处理线程完成"""
+        request = _Request(image, kwargs)
+        try:
+            self.requests.put_nowait(request)
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            return ("busy", None)
+        request.done.wait()
+        if request.error is not None:
+            return ("error", request.error)
+        return ("ok", request.result)
+
+    def _collect_batch(self):
+        """取出第一个请求后，在时间窗口内继续收集请求"""
+        batch = [self.requests.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _batch_loop(self):
+        """批处理线程：按尺寸和参数分组后合并识别"""
+        while True:
+            batch = self._collect_batch()
+            started = time.monotonic()
+            groups = {}
+            for request in batch:
+                groups.setdefault(request.batch_key, []).append(request)
+            for requests in groups.values():
+                try:
+                    if len(requests) == 1:
+                        results = [self.engine.readtext(requests[0].image, **requests[0].kwargs)]
+                    else:
+                        results = self.engine.reader.readtext_batched([r.image for r in requests],
+                                                                      **requests[0].kwargs)
+                    for request, result in zip(requests, results):
+                        request.result = result
+                except Exception as e:
+                    logger.error("OCR服务识别失败", exc_info=True)
+                    for request in requests:
+                        request.error = str(e)
+            finished = time.monotonic()
+            with self._stats_lock:
+                self.batches += len(groups)
+                self.completed += len(batch)
+                self.total_wait += sum(started - r.submitted for r in batch)
+                self.total_latency += sum(finished - r.submitted for r in batch)
+            for request in batch:
+                request.done.set()
+
+    def stats(self):
+        """返回吞吐量、延迟、批大小和拒绝次数"""
+        with self._stats_lock:
+            completed = max(self.completed, 1)
+            return {
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "batches": self.batches,
+                "avg_batch_size": self.completed / max(self.batches, 1),
+                "avg_queue_wait": self.total_wait / completed,
+                "avg_latency": self.total_latency / completed,
+                "throughput": self.completed / (time.monotonic() - self._started),
+                "queued": self.requests.qsize(),
+            }
+
+
+class OcrServiceClient:
+    """OCR服务客户端，队列满时按指数退避重试"""
+    def __init__(self, address=DEFAULT_ADDRESS, busy_timeout=30):
+        self.address = address
+        self.busy_timeout = busy_timeout
+        self._conn = Client(address, authkey=AUTHKEY)
+        self._lock = threading.Lock()
+
+    def _call(self, *message):
+        with self._lock:
+            self._conn.send(message)
+            return self._conn.recv()
+
+    def ping(self):
+        return self._call("ping")[0] == "ok"
+
+    def stats(self):
+        return self._call("stats")[1]
+
+    def readtext(self, image, **kwargs):
+        """提交识别请求，服务忙时退避重试，超过busy_timeout抛出ServiceBusy"""
+        deadline = time.monotonic() + self.busy_timeout
+        delay = 0.05
+        while True:
+            status, payload = self._call("readtext", image, kwargs)
+            if status == "ok":
+                return payload
+            if status == "error":
+                raise RuntimeError(f"OCR服务识别失败：{payload}")
+            if time.monotonic() + delay > deadline:
+                raise ServiceBusy("OCR服务队列已满")
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+    def close(self):
+        self._conn.close()
+
+
+def connect(address=DEFAULT_ADDRESS):
+    """尝试连接OCR服务，服务未运行时返回None"""
+    try:
+        client = OcrServiceClient(address)
+        if client.ping():
+            return client
+    except (OSError, EOFError):
+        pass
+    return None
+
+
+if __name__ == '__main__':
+    OcrService().serve_forever()
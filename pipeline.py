@@ -0,0 +1,155 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logger_handler import logger
+
+
+class ActionDispatcher:
+    """
+    动作执行器：在独立线程中执行点击命令。
+
+    点击执行期间以及点击完成后的settle秒内截取的画面都视为过期，
+    识别阶段据此丢弃点击前的旧画面，避免在过时的界面上重复点击。
+    """
+    def __init__(self, run_cmd, settle=1.0, adb="adb"):
+        """
+        Parameters:
+            run_cmd: 执行adb命令的函数
+            settle: 点击完成后等待界面响应的时间（秒）
+            adb: adb命令前缀，多设备时为"adb -s <serial>"
+        """
+        self.run_cmd = run_cmd
+        self.adb = adb
+        self.settle = settle
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Action")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._invalid_before = 0.0
+
+    @property
+    def pending(self):
+        """正在执行或排队中的动作数"""
+        with self._lock:
+            return self._pending
+
+    def submit(self, cmd):
+        """提交一条动作命令，立即返回"""
+        with self._lock:
+            self._pending += 1
+        return self._executor.submit(self._execute, cmd)
+
+    def tap(self, x, y):
+        """异步点击屏幕坐标"""
+        return self.submit(f'{self.adb} shell input tap {x} {y}')
+
+    def _execute(self, cmd):
+        """执行命令，完成后更新画面失效时间"""
+        try:
+            self.run_cmd(cmd)
+        except Exception as e:
+            logger.error(f"动作执行失败：{cmd}", exc_info=True)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._invalid_before = time.monotonic() + self.settle
+
+    def is_stale(self, captured_at):
+        """判断在captured_at时刻截取的画面是否已过期"""
+        with self._lock:
+            return self._pending > 0 or captured_at < self._invalid_before
+
+    def shutdown(self):
+        """等待剩余动作执行完毕并关闭执行器"""
+        self._executor.shutdown(wait=True)
+
+
+class PipelinedRunner:
+    """
+    流水线运行模式：截图、识别、动作三个阶段并行。
+
+    截图线程持续把画面放入有界队列（队列满时丢弃最旧的画面），
+    识别阶段在主线程消费画面，点击交给ActionDispatcher异步执行，
+    单次循环的耗时接近最慢阶段的耗时而不是各阶段之和。
+    """
+    def __init__(self, automation, max_loops=30, queue_size=2, settle=1.0, frame_timeout=10):
+        """
+        Parameters:
+            automation: ScreenAutomation实例
+            max_loops: 最多识别的画面数
+            queue_size: 画面队列长度
+            settle: 点击后等待界面响应的时间（秒），期间截取的画面会被丢弃
+            frame_timeout: 等待新画面的超时时间（秒）
+        """
+        self.automation = automation
+        self.max_loops = max_loops
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.dispatcher = ActionDispatcher(automation._run_cmd, settle, automation.adb)
+        self.frame_timeout = frame_timeout
+        self._stop_event = threading.Event()
+        self.captured = 0
+        self.stale = 0  # 因点击而失效被丢弃的画面数
+        self.overflow = 0  # 因队列已满被丢弃的画面数
+
+    def _capture_loop(self):
+        """截图线程：持续截取画面放入队列"""
+        while not self._stop_event.is_set():
+            if self.dispatcher.pending:
+                time.sleep(0.05)
+                continue
+            captured_at = time.monotonic()
+            frame = self.automation._grab_frame()
+            if frame is None:
+                time.sleep(0.5)
+                continue
+            self.captured += 1
+            while True:
+                try:
+                    self.frames.put_nowait((captured_at, frame))
+                    break
+                except queue.Full:
+                    try:
+                        self.frames.get_nowait()
+                        self.overflow += 1
+                    except queue.Empty:
+                        pass
+
+    def run(self):
+        """运行流水线，遇到结束条件或达到最大次数时停止，返回是否遇到了结束条件"""
+        capture_thread = threading.Thread(target=self._capture_loop, name="Capture", daemon=True)
+        self.automation.action_dispatcher = self.dispatcher
+        capture_thread.start()
+        loop_count = 0
+        ended = False
+        start = time.monotonic()
+        try:
+            while loop_count < self.max_loops:
+                try:
+                    captured_at, frame = self.frames.get(timeout=self.frame_timeout)
+                except queue.Empty:
+                    logger.warning(f"{self.frame_timeout}秒内未获取到新画面")
+                    loop_count += 1
+                    continue
+                if self.dispatcher.is_stale(captured_at):
+                    self.stale += 1
+                    continue
+
+                found, result_image, matched_text = self.automation.find_and_click_text(frame)
+                loop_count += 1
+                if found and self.automation._is_end_condition(matched_text):
+                    logger.info("已达到购买上限或商品库存不足，退出整体循环")
+                    ended = True
+                    break
+                elif found:
+                    logger.info(f"第{loop_count}次识别匹配到文本：'{matched_text}'")
+                else:
+                    logger.info(f"第{loop_count}次识别未匹配到文本，继续匹配")
+        finally:
+            self._stop_event.set()
+            capture_thread.join(timeout=10)
+            self.dispatcher.shutdown()
+            self.automation.action_dispatcher = None
+            elapsed = time.monotonic() - start
+            logger.info(f"流水线运行结束：识别{loop_count}帧，截图{self.captured}帧，丢弃过期画面{self.stale}帧，"
+                        f"队列溢出{self.overflow}帧，平均每次识别{elapsed / max(loop_count, 1):.2f}秒")
+        return ended
@@ -0,0 +1,38 @@
+import numpy as np
+
+# 区域OCR的辅助函数
+# 区域为{"name", "rect", "targets"}：rect为(左, 上, 右, 下)，按屏幕宽高的比例声明，以便适配不同分辨率；
+# targets为该区域内预期出现的文本，只保留包含其中任一文本的识别结果，为空列表时保留全部结果。
+# 各界面状态下识别哪些区域由规则引擎根据rules.yaml决定（见rule_engine.RuleEngine.active_regions）
+
+
+def region_box(region, width, height):
+    """将比例区域换算为像素坐标(x0, y0, x1, y1)"""
+    left, top, right, bottom = region["rect"]
+    return int(left * width), int(top * height), int(right * width), int(bottom * height)
+
+
+def covers_frame(regions):
+    """区域是否已覆盖整个画面，此时再做全屏识别没有意义"""
+    return any(tuple(region["rect"]) == (0.0, 0.0, 1.0, 1.0) for region in regions)
+
+
+def crop_region(frame, region):
+    """裁剪区域图像，返回裁剪图和其左上角在屏幕中的坐标"""
+    height, width = frame.shape[:2]
+    x0, y0, x1, y1 = region_box(region, width, height)
+    return np.ascontiguousarray(frame[y0:y1, x0:x1]), (x0, y0)
+
+
+def map_to_screen(results, offset):
+    """将裁剪图内的识别结果坐标映射回屏幕坐标"""
+    dx, dy = offset
+    return [([[int(x) + dx, int(y) + dy] for x, y in bbox], text, prob) for bbox, text, prob in results]
+
+
+def filter_targets(results, region):
+    """只保留区域预期文本相关的识别结果"""
+    targets = region.get("targets")
+    if not targets:
+        return results
+    return [item for item in results if any(target in item[1] for target in targets)]
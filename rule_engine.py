@@ -0,0 +1,300 @@
+from bisect import bisect_right
+from collections import deque
+from pathlib import Path
+import yaml
+from logger_handler import logger
+
+project_path = Path(__file__).parent
+rules_path = project_path / 'rules.yaml'
+
+ACTIONS = ("tap_point", "tap_text", "end")
+REFERENCE_SIZE = (1920, 1080)  # 以像素声明的坐标所基于的参考分辨率
+
+
+def resolve_point(point, width, height, reference=REFERENCE_SIZE):
+    """
+    将坐标换算为当前画面的像素坐标。
+
+    两个值都是不大于1的小数时按屏幕比例换算，否则视为reference分辨率下的像素坐标按比例缩放。
+    """
+    x, y = point
+    if all(isinstance(v, float) and 0 <= v <= 1 for v in point):
+        return int(round(x * width)), int(round(y * height))
+    return int(round(x * width / reference[0])), int(round(y * height / reference[1]))
+
+
+class AhoCorasick:
+    """多模式字符串匹配自动机，一次扫描找出文本中出现的所有模式"""
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for index, pattern in enumerate(self.patterns):
+            self._insert(pattern, index)
+        self._build_failure_links()
+
+    def _insert(self, pattern, index):
+        """把模式加入字典树"""
+        state = 0
+        for char in pattern:
+            if char not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = len(self._goto) - 1
+            state = self._goto[state][char]
+        self._output[state].append(index)
+
+    def _build_failure_links(self):
+        """按层次遍历构建失配指针，并合并后缀状态的输出"""
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, child in self._goto[state].items():
+                pending.append(child)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def iter(self, text):
+        """依次产出(结束位置, 模式序号)"""
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for index in self._output[state]:
+                yield position, index
+
+
+class Rule:
+    """一条编译后的规则"""
+    def __init__(self, index, config):
+        self.index = index  # 在规则文件中的位置，越小优先级越高
+        self.name = config["name"]
+        self.action = config.get("action", "tap_text")
+        if self.action not in ACTIONS:
+            raise ValueError(f"规则{self.name}的action无效：{self.action}，可选：{', '.join(ACTIONS)}")
+        self.point = tuple(config["point"]) if config.get("point") else None
+        if self.action == "tap_point" and self.point is None:
+            raise ValueError(f"规则{self.name}缺少点击坐标point")
+        self.match = list(config.get("match") or [])
+        self.exact = list(config.get("exact") or [])
+        if not self.match and not self.exact:
+            raise ValueError(f"规则{self.name}没有配置match或exact")
+        region = config.get("region") or []
+        self.regions = [region] if isinstance(region, str) else list(region)
+        self.states = set(config["states"]) if config.get("states") else None
+        self.next = config.get("next")
+
+    @property
+    def is_terminal(self):
+        return self.action == "end"
+
+    @property
+    def patterns(self):
+        return self.match + self.exact
+
+    def active_in(self, state):
+        """规则在该状态下是否生效，state为None时视为所有规则都生效；结束条件在所有状态下都生效"""
+        return state is None or self.states is None or self.is_terminal or state in self.states
+
+    def point_at(self, width, height):
+        """tap_point规则在当前画面中的点击坐标"""
+        return resolve_point(self.point, width, height)
+
+
+class RuleEngine:
+    """
+    规则引擎：把规则文件编译为一个Aho-Corasick自动机和界面状态机。
+
+    每帧的所有识别文本只扫描一遍即可得到命中的规则，
+    并根据当前界面状态告诉识别层需要识别哪些区域、每个区域内有哪些规则可能命中。
+    """
+    def __init__(self, config):
+        """
+        Parameters:
+            config: 规则配置，结构见rules.yaml
+        """
+        self.regions = {name: tuple(rect) for name, rect in (config.get("regions") or {}).items()}
+        self.states = {name: list(regions or []) for name, regions in (config.get("states") or {}).items()}
+        self.initial_state = config.get("initial_state")
+        if self.initial_state is not None and self.initial_state not in self.states:
+            raise ValueError(f"初始状态未定义：{self.initial_state}")
+        self.rules = [Rule(index, rule) for index, rule in enumerate(config.get("rules") or [])]
+        self._validate()
+
+        patterns = []
+        self._pattern_rules = []  # 模式序号 -> 包含该模式的规则
+        self._exact_rules = {}  # 文本 -> 完全匹配该文本的规则
+        for rule in self.rules:
+            for pattern in rule.match:
+                if pattern in patterns:
+                    self._pattern_rules[patterns.index(pattern)].append(rule)
+                else:
+                    patterns.append(pattern)
+                    self._pattern_rules.append([rule])
+            for text in rule.exact:
+                self._exact_rules.setdefault(text, []).append(rule)
+        self._automaton = AhoCorasick(patterns)
+        self._region_cache = {}
+        self._rule_cache = {}
+        self._terminal_cache = {}
+        logger.info(f"规则编译完成：{len(self.rules)}条规则，{len(patterns) + len(self._exact_rules)}个模式，"
+                    f"{len(self.states)}个界面状态")
+
+    @classmethod
+    def load(cls, path=rules_path):
+        """读取并编译规则文件"""
+        with open(path, encoding='utf-8') as f:
+            return cls(yaml.safe_load(f) or {})
+
+    def _validate(self):
+        """检查规则引用的区域和状态是否都已定义"""
+        for state, regions in self.states.items():
+            for region in regions:
+                if region not in self.regions:
+                    raise ValueError(f"状态{state}引用了未定义的区域：{region}")
+        for rule in self.rules:
+            for region in rule.regions:
+                if region not in self.regions:
+                    raise ValueError(f"规则{rule.name}引用了未定义的区域：{region}")
+            for state in (rule.states or set()) | ({rule.next} if rule.next else set()):
+                if state not in self.states:
+                    raise ValueError(f"规则{rule.name}引用了未定义的状态：{state}")
+
+    def match(self, texts, state=None):
+        """
+        一次扫描所有文本，找出优先级最高的命中规则。
+
+        画面中任一文本命中结束条件时直接返回该结束条件，不会先执行同一画面中其他文本的点击；
+        其余情况下取识别结果中靠前的命中文本，同一文本命中多条规则时取优先级高的规则。
+
+        Parameters:
+            texts: 按识别结果顺序排列的文本列表
+            state: 当前界面状态，为None时所有规则都参与匹配
+
+        Returns:
+            (文本序号, 规则, 命中的模式)，没有命中时返回None
+        """
+        best = {}  # 文本序号 -> (规则, 模式)
+        for i, text in enumerate(texts):
+            for rule in self._exact_rules.get(text, ()):
+                if rule.active_in(state) and (i not in best or rule.index < best[i][0].index):
+                    best[i] = (rule, text)
+        # 文本之间用换行分隔后拼接，模式中不含换行，因此不会跨文本命中
+        starts = []
+        position = 0
+        for text in texts:
+            starts.append(position)
+            position += len(text) + 1
+        for end, pattern_index in self._automaton.iter("\n".join(texts)):
+            i = bisect_right(starts, end) - 1
+            for rule in self._pattern_rules[pattern_index]:
+                if rule.active_in(state) and (i not in best or rule.index < best[i][0].index):
+                    best[i] = (rule, self._automaton.patterns[pattern_index])
+        if not best:
+            return None
+        terminal = [i for i in sorted(best) if best[i][0].is_terminal]
+        i = terminal[0] if terminal else min(best)
+        return (i,) + best[i]
+
+    def is_terminal(self, text):
+        """文本是否命中任一结束条件，与该文本同时命中的其他规则无关"""
+        if any(rule.is_terminal for rule in self._exact_rules.get(text, ())):
+            return True
+        return any(rule.is_terminal for _, index in self._automaton.iter(text) for rule in self._pattern_rules[index])
+
+    def next_state(self, rule, state):
+        """执行规则后的界面状态"""
+        return rule.next or state
+
+    def active_rules(self, state):
+        """当前状态下生效的规则，按优先级排列"""
+        if state not in self._rule_cache:
+            self._rule_cache[state] = [rule for rule in self.rules if rule.active_in(state)]
+        return self._rule_cache[state]
+
+    @staticmethod
+    def _merge_overlapping(regions):
+        """把相互重叠的区域合并为外接矩形，避免同一块画面被识别多次"""
+        regions = [dict(region, targets=list(region["targets"])) for region in regions]
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(regions)):
+                for j in range(i + 1, len(regions)):
+                    a, b = regions[i]["rect"], regions[j]["rect"]
+                    if min(a[2], b[2]) <= max(a[0], b[0]) or min(a[3], b[3]) <= max(a[1], b[1]):
+                        continue
+                    regions[i] = {
+                        "name": f"{regions[i]['name']}+{regions[j]['name']}",
+                        "rect": (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])),
+                        "targets": regions[i]["targets"] + [p for p in regions[j]["targets"]
+                                                            if p not in regions[i]["targets"]],
+                    }
+                    del regions[j]
+                    merged = True
+                    break
+                if merged:
+                    break
+        return regions
+
+    def active_regions(self, state):
+        """
+        当前状态下需要识别的区域及每个区域内可能命中的模式，结构与roi_profiles中的区域一致。
+
+        状态下没有任何规则可能命中的区域直接跳过；结束条件所在的区域在所有状态下都会识别；
+        相互重叠的区域合并为一个外接矩形后识别。
+        """
+        if state not in self._region_cache:
+            regions = []
+            names = list(self.states.get(state, []))
+            for rule in self.rules:
+                if rule.is_terminal:
+                    names += [name for name in rule.regions if name not in names]
+            for name in names:
+                targets = []
+                for rule in self.rules:
+                    if name in rule.regions and rule.active_in(state):
+                        targets += [p for p in rule.patterns if p not in targets]
+                if targets:
+                    regions.append({"name": name, "rect": self.regions[name], "targets": targets})
+            self._region_cache[state] = self._merge_overlapping(regions)
+        return self._region_cache[state]
+
+    def terminal_regions(self, state):
+        """
+        当前状态下结束条件规则所在的区域，每个区域只保留结束条件的模式。
+
+        用于不经过OCR的点击（如模板匹配）之前确认画面中没有结束条件；结束条件未声明区域时识别全屏。
+        """
+        if state not in self._terminal_cache:
+            regions = {}
+            for rule in self.active_rules(state):
+                if not rule.is_terminal:
+                    continue
+                for name in rule.regions or ["full"]:
+                    rect = self.regions[name] if name != "full" else (0.0, 0.0, 1.0, 1.0)
+                    region = regions.setdefault(name, {"name": name, "rect": rect, "targets": []})
+                    region["targets"] += [p for p in rule.patterns if p not in region["targets"]]
+            self._terminal_cache[state] = list(regions.values())
+        return self._terminal_cache[state]
+
+    def all_patterns(self):
+        """所有规则中声明的文本模式"""
+        return sorted({pattern for rule in self.rules for pattern in rule.patterns})
+
+
+_engines = {}
+
+
+def get_rule_engine(path=rules_path):
+    """按路径获取编译后的规则引擎，同一进程内只编译一次"""
+    key = str(path)
+    if key not in _engines:
+        _engines[key] = RuleEngine.load(path)
+    return _engines[key]
@@ -0,0 +1,172 @@
+import datetime
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from logger_handler import logger
+
+project_path = Path(__file__).parent
+stats_path = project_path / 'out_files' / 'schedule_stats.json'
+
+SPIN_THRESHOLD = 0.002  # 距离截止时间小于该值（秒）时改为自旋等待，避免线程唤醒延迟
+
+
+class PrecisionScheduler:
+    """
+    按目标时间精确触发任务的调度器。
+
+    每个目标时间分为两个阶段：预热阶段提前启动（加载模型、建立ADB连接、启动app并等待就绪），
+    提前量由历史预热耗时估算；预热完成后按单调时钟的截止时间触发关键任务，
+    并记录任务第一次关键操作与目标时间的偏差。等待期间使用可中断的事件等待，不做轮询。
+    """
+    def __init__(self, targets, prewarm, fire, default_lead=120, min_lead=30, max_lead=600, safety=1.2,
+                 margin=10, history=20, stats_path=stats_path):
+        """
+        Parameters:
+            targets: 每天的目标时间列表，格式为"HH:MM"或"HH:MM:SS"
+            prewarm: 预热函数，参数为本次的目标时间（datetime），返回值传给fire
+            fire: 关键任务函数，在目标时间调用；返回第一次关键操作（如点击）的时间（time.time()）时，
+                  记录该时间与目标时间的偏差
+            default_lead: 没有历史记录时的预热提前量（秒）
+            min_lead: 预热提前量下限（秒）
+            max_lead: 预热提前量上限（秒）
+            safety: 历史最长预热耗时的放大系数
+            margin: 在放大后的预热耗时基础上额外预留的时间（秒）
+            history: 保留的历史记录条数
+            stats_path: 预热耗时和触发偏差的记录文件
+        """
+        self.targets = sorted(self._parse(target) for target in targets)
+        if not self.targets:
+            raise ValueError("至少需要一个目标时间")
+        self.prewarm = prewarm
+        self.fire = fire
+        self.default_lead = default_lead
+        self.min_lead = min_lead
+        self.max_lead = max_lead
+        self.safety = safety
+        self.margin = margin
+        self.history = history
+        self.stats_path = stats_path
+        self._stop_event = threading.Event()
+
+    @staticmethod
+    def _parse(target):
+        parts = [int(part) for part in target.split(":")]
+        return datetime.time(*parts)
+
+    def next_target(self, now=None):
+        """下一个目标时间（本地时间）"""
+        now = now or datetime.datetime.now()
+        for day in range(2):
+            date = now.date() + datetime.timedelta(days=day)
+            for target in self.targets:
+                candidate = datetime.datetime.combine(date, target)
+                if candidate > now:
+                    return candidate
+        raise RuntimeError("无法计算下一个目标时间")
+
+    def _load_stats(self):
+        if not os.path.exists(self.stats_path):
+            return {}
+        try:
+            with open(self.stats_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"调度记录无法读取，忽略：{e}")
+            return {}
+
+    def _record(self, **values):
+        """追加预热耗时、触发偏差等记录"""
+        try:
+            stats = self._load_stats()
+            for key, value in values.items():
+                records = stats.setdefault(key, [])
+                records.append(round(value, 4))
+                del records[:-self.history]
+            os.makedirs(os.path.dirname(self.stats_path), exist_ok=True)
+            with open(self.stats_path, 'w', encoding='utf-8') as f:
+                json.dump(stats, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logger.error(f"保存调度记录失败：{e}", exc_info=True)
+
+    def expected_lead(self):
+        """根据历史预热耗时估算需要提前多久开始预热（秒）"""
+        records = self._load_stats().get("prewarm")
+        if not records:
+            return self.default_lead
+        return min(self.max_lead, max(self.min_lead, max(records) * self.safety + self.margin))
+
+    def _wait_wall(self, when):
+        """等待到指定的本地时间，期间系统时间被调整时按新的时间重新计算；返回是否被stop中断"""
+        while not self._stop_event.is_set():
+            remaining = (when - datetime.datetime.now()).total_seconds()
+            if remaining <= 0:
+                return False
+            self._stop_event.wait(min(remaining, 60))
+        return True
+
+    def _wait_until(self, deadline):
+        """等待到单调时钟的截止时间，最后几毫秒自旋以减小唤醒误差；返回是否被stop中断"""
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= SPIN_THRESHOLD:
+                break
+            if self._stop_event.wait(remaining - SPIN_THRESHOLD):
+                return True
+        while time.monotonic() < deadline:
+            pass
+        return False
+
+    def run_once(self, target):
+        """执行一次预热和触发"""
+        lead = self.expected_lead()
+        logger.info(f"下一个目标时间{target:%Y-%m-%d %H:%M:%S}，提前{lead:.0f}秒开始预热")
+        if self._wait_wall(target - datetime.timedelta(seconds=lead)):
+            return
+        # 目标时间换算为单调时钟的截止时间，之后不受系统时间调整影响
+        deadline = time.monotonic() + (target - datetime.datetime.now()).total_seconds()
+
+        start = time.monotonic()
+        context = None
+        warmed = True
+        try:
+            context = self.prewarm(target)
+        except Exception as e:
+            logger.error(f"预热失败，到目标时间后直接运行：{e}", exc_info=True)
+            warmed = False
+        prewarm_time = time.monotonic() - start
+        slack = deadline - time.monotonic()
+        if slack >= 0:
+            logger.info(f"预热完成，耗时{prewarm_time:.1f}秒，距目标时间还有{slack:.1f}秒")
+        else:
+            logger.warning(f"预热耗时{prewarm_time:.1f}秒，超过目标时间{-slack:.1f}秒，立即运行")
+
+        if self._wait_until(deadline):
+            return
+        fired = time.monotonic()
+        jitter = fired - deadline  # 调度本身的唤醒偏差，通常不到1毫秒
+        logger.debug(f"触发任务，调度唤醒偏差{jitter * 1000:+.1f}毫秒")
+        self._record(**({"prewarm": prewarm_time} if warmed else {}), jitter=jitter)
+        first_action = None
+        try:
+            first_action = self.fire(context)
+        except Exception as e:
+            logger.error(f"任务运行失败：{e}", exc_info=True)
+        logger.info(f"任务运行结束，耗时{time.monotonic() - fired:.1f}秒")
+        if isinstance(first_action, (int, float)):
+            # 实际落点：第一次关键操作与目标时间的偏差，包含调度、截图、识别和点击的全部延迟
+            offset = first_action - target.timestamp()
+            logger.info(f"第一次点击与目标时间{target:%H:%M:%S}的偏差{offset * 1000:+.0f}毫秒")
+            self._record(first_action=offset)
+        else:
+            logger.warning(f"本次运行没有记录到点击时间，无法统计与目标时间{target:%H:%M:%S}的偏差")
+
+    def run_forever(self):
+        """依次等待每个目标时间，直到stop被调用"""
+        while not self._stop_event.is_set():
+            self.run_once(self.next_target())
+
+    def stop(self):
+        """中断等待并在当前任务结束后退出"""
+        self._stop_event.set()
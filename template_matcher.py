@@ -0,0 +1,128 @@
+import os
+import cv2
+from logger_handler import logger
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+REFERENCE_WIDTH = 1920  # 模板截取时的屏幕宽度
+
+# 模板库配置
+# file: templates目录下的参考截图，按参考分辨率截取
+# text: 匹配成功时等价的OCR文本，沿用文本匹配的处理逻辑
+# click: 点击位置，默认点击模板中心；填写其他模板名称时点击该模板的匹配位置（如弹窗标题→关闭按钮）
+# rect: 可选的搜索区域(左, 上, 右, 下)，按屏幕比例声明
+# standalone: 为False时该模板只作为其他模板的点击位置，单独匹配到时不点击
+TEMPLATES = [
+    {"name": "login", "file": "login.png", "text": "登录"},
+    {"name": "shop", "file": "shop.png", "text": "商店"},
+    {"name": "enter_shelter", "file": "enter_shelter.png", "text": "进入避难所"},
+    {"name": "close", "file": "close.png", "text": "关闭", "rect": (0.85, 0.00, 1.00, 0.15), "standalone": False},
+    {"name": "popup_collection", "file": "popup_collection.png", "text": "收藏图鉴", "click": "close",
+     "rect": (0.00, 0.00, 1.00, 0.14)},
+    {"name": "popup_compass", "file": "popup_compass.png", "text": "神秘罗盘", "click": "close",
+     "rect": (0.00, 0.00, 1.00, 0.14)},
+]
+
+
+class TemplateMatcher:
+    """
+    固定界面元素的模板匹配。
+
+    在缩小后的灰度画面上用cv2.matchTemplate查找参考截图，并在多个缩放比例下尝试，
+    以适配华为版等不同分辨率。模板文件不存在时跳过该模板。
+    """
+    def __init__(self, templates=None, template_dir=TEMPLATE_DIR, threshold=0.85, downscale=0.5,
+                 scales=(0.9, 1.0, 1.1)):
+        """
+        Parameters:
+            templates: 模板配置列表，默认使用TEMPLATES
+            template_dir: 模板图片目录
+            threshold: 匹配置信度阈值（TM_CCOEFF_NORMED）
+            downscale: 匹配前画面的缩小比例
+            scales: 在分辨率换算比例基础上额外尝试的缩放系数
+        """
+        self.threshold = threshold
+        self.downscale = downscale
+        self.scales = scales
+        self.templates = {}
+        self._scaled = {}
+        for config in templates or TEMPLATES:
+            image = cv2.imread(os.path.join(template_dir, config["file"]), cv2.IMREAD_GRAYSCALE)
+            if image is None:
+                logger.debug(f"模板文件不存在，跳过：{config['file']}")
+                continue
+            self.templates[config["name"]] = dict(config, image=image)
+        if self.templates:
+            logger.info(f"已加载{len(self.templates)}个模板")
+        else:
+            logger.debug(f"模板目录中没有可用的模板，模板匹配不生效：{template_dir}")
+
+    def __bool__(self):
+        return bool(self.templates)
+
+    def _scaled_template(self, name, scale):
+        """获取按比例缩放后的模板，结果缓存复用"""
+        key = (name, round(scale, 3))
+        if key not in self._scaled:
+            image = self.templates[name]["image"]
+            width = max(1, int(image.shape[1] * scale))
+            height = max(1, int(image.shape[0] * scale))
+            self._scaled[key] = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+        return self._scaled[key]
+
+    def match(self, gray, name):
+        """在缩小后的灰度画面中查找模板，返回屏幕坐标下的匹配结果或None"""
+        config = self.templates[name]
+        height, width = gray.shape[:2]
+        x0, y0 = 0, 0
+        if config.get("rect"):
+            left, top, right, bottom = config["rect"]
+            x0, y0 = int(left * width), int(top * height)
+            gray = gray[y0:int(bottom * height), x0:int(right * width)]
+
+        # 画面已缩小downscale倍，模板需同时按分辨率和downscale缩放
+        base = width / REFERENCE_WIDTH
+        best = None
+        for factor in self.scales:
+            template = self._scaled_template(name, base * factor)
+            if template.shape[0] > gray.shape[0] or template.shape[1] > gray.shape[1]:
+                continue
+            _, score, _, loc = cv2.minMaxLoc(cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED))
+            if best is None or score > best[0]:
+                best = (score, loc, template.shape)
+        if best is None or best[0] < self.threshold:
+            return None
+
+        score, (x, y), (t_height, t_width) = best
+        left, top = (x + x0) / self.downscale, (y + y0) / self.downscale
+        right, bottom = left + t_width / self.downscale, top + t_height / self.downscale
+        return {
+            "name": name,
+            "text": config["text"],
+            "score": score,
+            "bbox": [[int(left), int(top)], [int(right), int(top)], [int(right), int(bottom)], [int(left), int(bottom)]],
+            "x": int((left + right) / 2),
+            "y": int((top + bottom) / 2),
+        }
+
+    def find(self, frame):
+        """按配置顺序查找第一个可点击的模板，返回匹配结果（含点击坐标）或None"""
+        if not self.templates:
+            return None
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        gray = cv2.resize(gray, None, fx=self.downscale, fy=self.downscale, interpolation=cv2.INTER_AREA)
+        for name, config in self.templates.items():
+            if config.get("standalone") is False:
+                continue
+            hit = self.match(gray, name)
+            if hit is None:
+                continue
+            target = config.get("click")
+            if target:
+                if target not in self.templates:
+                    continue
+                click_hit = self.match(gray, target)
+                if click_hit is None:
+                    continue
+                hit["x"], hit["y"] = click_hit["x"], click_hit["y"]
+            return hit
+        return None
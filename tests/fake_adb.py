@@ -0,0 +1,123 @@
+import socket
+import struct
+import threading
+import time
+
+from adb_transport import SHELL_EXIT, SHELL_STDERR, SHELL_STDOUT
+
+
+def v2_packet(packet_id, payload=b""):
+    """构造一个shell v2数据包"""
+    return struct.pack('<BI', packet_id, len(payload)) + payload
+
+
+def v2_response(stdout=b"", stderr=b"", returncode=0):
+    """构造shell v2命令的完整输出：stdout、stderr和退出码"""
+    data = b""
+    if stdout:
+        data += v2_packet(SHELL_STDOUT, stdout)
+    if stderr:
+        data += v2_packet(SHELL_STDERR, stderr)
+    return data + v2_packet(SHELL_EXIT, bytes([returncode]))
+
+
+class Fail:
+    """服务请求的FAIL响应"""
+    def __init__(self, message):
+        self.message = message
+
+
+class FakeAdbServer:
+    """
+    测试用的最小adb server。
+
+    监听本地随机端口，按adb协议处理host:transport请求和设备服务请求：
+    services把服务前缀（如"shell,v2,raw:"、"shell:"、"exec:"）映射到函数，
+    函数参数为设备端命令，返回响应数据（bytes）或Fail；未配置的服务返回FAIL。
+    收到的请求按顺序记录在requests中。chunk_size不为None时按该大小分块发送响应，用于测试分包读取。
+    """
+    def __init__(self, devices=("emulator-5554",), services=None, chunk_size=None):
+        self.devices = list(devices)
+        self.services = services or {}
+        self.chunk_size = chunk_size
+        self.requests = []
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen(8)
+        self.port = self._sock.getsockname()[1]
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._sock.close()
+        return False
+
+    @staticmethod
+    def _recv_request(conn):
+        length = int(FakeAdbServer._recv_exact(conn, 4), 16)
+        return FakeAdbServer._recv_exact(conn, length).decode('utf-8')
+
+    @staticmethod
+    def _recv_exact(conn, size):
+        data = b""
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("客户端已断开")
+            data += chunk
+        return data
+
+    @staticmethod
+    def _fail(conn, message):
+        data = message.encode('utf-8')
+        conn.sendall(b"FAIL" + b"%04x" % len(data) + data)
+
+    def _send(self, conn, data):
+        if self.chunk_size is None:
+            conn.sendall(data)
+            return
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        for i in range(0, len(data), self.chunk_size):
+            conn.sendall(data[i:i + self.chunk_size])
+            time.sleep(0.001)
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            with conn:
+                try:
+                    self._handle(conn)
+                except ConnectionError:
+                    pass
+
+    def _handle(self, conn):
+        request = self._recv_request(conn)
+        self.requests.append(request)
+        if request == "host:transport-any":
+            serial = self.devices[0] if len(self.devices) == 1 else None
+        else:
+            serial = request[len("host:transport:"):]
+        if serial not in self.devices:
+            self._fail(conn, f"device '{serial}' not found" if serial else "more than one device/emulator")
+            return
+        conn.sendall(b"OKAY")
+
+        service = self._recv_request(conn)
+        self.requests.append(service)
+        for prefix, handler in self.services.items():
+            if service.startswith(prefix):
+                response = handler(service[len(prefix):])
+                break
+        else:
+            response = Fail("closed")
+        if isinstance(response, Fail):
+            self._fail(conn, response.message)
+            return
+        conn.sendall(b"OKAY")
+        self._send(conn, response)
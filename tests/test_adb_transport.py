@@ -0,0 +1,129 @@
+import socket
+import subprocess
+
+import pytest
+
+import adb_transport
+from adb_transport import AdbError, AdbServiceError, AdbTransport, run_adb
+from fake_adb import Fail, FakeAdbServer, v2_response
+
+SERIAL = "emulator-5554"
+
+
+def transport(server, serial=SERIAL):
+    return AdbTransport(serial, port=server.port, timeout=5)
+
+
+def test_shell_v2_returns_stdout():
+    services = {"shell,v2,raw:": lambda cmd: v2_response(stdout=b"hello\n")}
+    with FakeAdbServer(services=services) as server:
+        assert transport(server).shell("echo hello") == "hello\n"
+    assert server.requests == [f"host:transport:{SERIAL}", "shell,v2,raw:echo hello"]
+
+
+def test_transport_any_without_serial():
+    services = {"shell,v2,raw:": lambda cmd: v2_response(stdout=b"ok")}
+    with FakeAdbServer(services=services) as server:
+        assert transport(server, serial=None).shell("true") == "ok"
+    assert server.requests[0] == "host:transport-any"
+
+
+def test_transport_fail_raises_adb_error():
+    with FakeAdbServer() as server:
+        with pytest.raises(AdbError, match="device 'missing' not found") as excinfo:
+            transport(server, serial="missing").shell("true")
+    # 设备不存在不是服务被拒绝，不能触发v1回退
+    assert not isinstance(excinfo.value, AdbServiceError)
+
+
+def test_shell_v2_nonzero_exit_raises_called_process_error():
+    services = {"shell,v2,raw:": lambda cmd: v2_response(stdout=b"partial", stderr=b"not found\n", returncode=127)}
+    with FakeAdbServer(services=services) as server:
+        with pytest.raises(subprocess.CalledProcessError) as excinfo:
+            transport(server).shell("missing-command")
+    error = excinfo.value
+    assert error.returncode == 127
+    assert error.cmd == "missing-command"
+    assert error.output == b"partial"
+    assert error.stderr == b"not found\n"
+
+
+def test_shell_v2_reads_fragmented_packets():
+    stdout = b"x" * 1000
+    services = {"shell,v2,raw:": lambda cmd: v2_response(stdout=stdout, stderr=b"warn")}
+    with FakeAdbServer(services=services, chunk_size=3) as server:
+        assert transport(server).shell("cat file") == stdout.decode()
+
+
+def test_shell_v2_without_exit_packet_raises():
+    services = {"shell,v2,raw:": lambda cmd: b""}
+    with FakeAdbServer(services=services) as server:
+        with pytest.raises(AdbError, match="未返回退出码"):
+            transport(server).shell("true")
+
+
+def test_falls_back_to_shell_v1_when_v2_is_refused():
+    services = {
+        "shell,v2,raw:": lambda cmd: Fail("closed"),
+        "shell:": lambda cmd: b"v1 output",
+    }
+    with FakeAdbServer(services=services) as server:
+        client = transport(server)
+        assert client.shell("getprop") == "v1 output"
+        assert client.shell_v2 is False
+        assert client.shell("getprop") == "v1 output"
+    # 第二次调用直接使用v1协议，不再尝试v2
+    assert server.requests == [f"host:transport:{SERIAL}", "shell,v2,raw:getprop",
+                               f"host:transport:{SERIAL}", "shell:getprop",
+                               f"host:transport:{SERIAL}", "shell:getprop"]
+
+
+def test_exec_out_returns_raw_bytes():
+    frame = bytes(range(256)) * 4096  # 1MB，包含非UTF-8字节
+    with FakeAdbServer(services={"exec:": lambda cmd: frame}) as server:
+        assert transport(server).exec_out("screencap") == frame
+    assert server.requests[-1] == "exec:screencap"
+
+
+def test_batch_joins_commands_into_one_shell():
+    services = {"shell,v2,raw:": lambda cmd: v2_response()}
+    with FakeAdbServer(services=services) as server:
+        transport(server).batch(["input tap 1 2", "input tap 3 4"])
+    assert server.requests[-1] == "shell,v2,raw:input tap 1 2 ; input tap 3 4"
+
+
+@pytest.fixture
+def routed(monkeypatch):
+    """让run_adb使用指向假adb server的传输层"""
+    def route(server, serial=SERIAL):
+        monkeypatch.setitem(adb_transport._transports, serial, transport(server, serial))
+    return route
+
+
+def test_run_adb_exec_out_binary(routed):
+    with FakeAdbServer(services={"exec:": lambda cmd: b"\x89PNG\x00\xff"}) as server:
+        routed(server)
+        assert run_adb(f"adb -s {SERIAL} exec-out screencap -p", binary=True) == b"\x89PNG\x00\xff"
+    assert server.requests[-1] == "exec:screencap -p"
+
+
+def test_run_adb_shell_text(routed):
+    services = {"shell,v2,raw:": lambda cmd: v2_response(stdout=b"1234\n")}
+    with FakeAdbServer(services=services) as server:
+        routed(server)
+        assert run_adb(f'adb -s {SERIAL} shell "pidof com.netease.yhtj; true"') == "1234\n"
+    assert server.requests[-1] == "shell,v2,raw:pidof com.netease.yhtj; true"
+
+
+def test_run_adb_ignores_other_commands():
+    assert run_adb("adb pull /sdcard/a.png") is None
+    assert run_adb("adb devices") is None
+    assert run_adb("echo hi") is None
+
+
+def test_run_adb_returns_none_when_server_is_down(monkeypatch):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]  # 关闭后该端口上没有监听
+    monkeypatch.setitem(adb_transport._transports, SERIAL, AdbTransport(SERIAL, port=port, timeout=5))
+    assert run_adb(f"adb -s {SERIAL} shell true") is None
@@ -0,0 +1,146 @@
+import pytest
+
+from rule_engine import AhoCorasick, RuleEngine, resolve_point, rules_path
+
+STATES = [None, "unknown", "login", "lobby", "shop"]
+
+
+@pytest.fixture(scope="module")
+def engine():
+    return RuleEngine.load(rules_path)
+
+
+def names(regions):
+    return sorted(region["name"] for region in regions)
+
+
+@pytest.mark.parametrize("state", STATES)
+@pytest.mark.parametrize("texts", [
+    ["已达到购买上限", "我知道了"],
+    ["我知道了", "已达到购买上限"],
+    ["登录", "账号在别处登录"],
+    ["尊享会员", "商品库存不足"],
+    ["商店", "购物", "库存: 0"],
+])
+def test_end_beats_tap_on_same_frame(engine, state, texts):
+    index, rule, _ = engine.match(texts, state)
+    assert rule.name == "end"
+    assert rule.is_terminal
+    assert texts[index] != "我知道了"
+
+
+def test_first_hit_text_wins_without_end(engine):
+    index, rule, pattern = engine.match(["获奖记录", "我知道了"], "lobby")
+    assert (index, rule.name, pattern) == (0, "close_popup", "获奖记录")
+
+
+def test_close_popup_active_in_every_state(engine):
+    for state in STATES:
+        assert engine.match(["一键领取"], state)[1].name == "close_popup"
+
+
+def test_same_text_takes_higher_priority_rule(engine):
+    # 文本同时包含两条规则的模式时取规则文件中靠前的规则
+    assert engine.match(["前往 我知道了"], "unknown")[1].name == "close_popup"
+
+
+def test_state_scoped_rule(engine):
+    assert engine.match(["购物"], "shop")[1].name == "buy"
+    assert engine.match(["购物"], "lobby") is None
+
+
+def test_exact_requires_whole_text(engine):
+    assert engine.match(["登录"], "unknown")[1].name == "login"
+    assert engine.match(["登录游戏"], "unknown") is None
+    assert engine.match(["商店"], "lobby")[1].name == "open_shop"
+    assert engine.match(["商店街"], "lobby") is None
+
+
+def test_match_does_not_span_texts(engine):
+    assert engine.match(["已达到", "购买上限"], "shop") is None
+
+
+def test_is_terminal(engine):
+    assert engine.is_terminal("提示：已达到购买上限")
+    assert not engine.is_terminal("我知道了")
+
+
+def test_next_state(engine):
+    rule = engine.match(["进入避难所"], "login")[1]
+    assert engine.next_state(rule, "login") == "lobby"
+    rule = engine.match(["我知道了"], "lobby")[1]
+    assert engine.next_state(rule, "lobby") == "lobby"
+
+
+@pytest.mark.parametrize("state, expected", [
+    ("login", ["login_button+toast", "title_bar+notice"]),
+    ("shop", ["dialog+toast", "title_bar"]),
+])
+def test_active_regions_merge_overlapping(engine, state, expected):
+    regions = engine.active_regions(state)
+    assert names(regions) == expected
+    for region in regions:
+        assert region["targets"]
+
+
+def test_active_regions_merged_to_full_frame(engine):
+    for state in ("unknown", "lobby"):
+        regions = engine.active_regions(state)
+        assert len(regions) == 1
+        assert regions[0]["rect"] == (0.0, 0.0, 1.0, 1.0)
+
+
+def test_active_regions_include_terminal_targets(engine):
+    for state in STATES[1:]:
+        targets = [p for region in engine.active_regions(state) for p in region["targets"]]
+        assert "已达到购买上限" in targets
+
+
+def test_merge_overlapping_keeps_disjoint_regions():
+    regions = [
+        {"name": "a", "rect": (0.0, 0.0, 0.5, 0.5), "targets": ["x"]},
+        {"name": "b", "rect": (0.5, 0.5, 1.0, 1.0), "targets": ["y"]},
+        {"name": "c", "rect": (0.4, 0.4, 0.6, 0.6), "targets": ["x", "z"]},
+    ]
+    merged = RuleEngine._merge_overlapping(regions)
+    assert len(merged) == 1
+    assert merged[0]["rect"] == (0.0, 0.0, 1.0, 1.0)
+    assert sorted(merged[0]["targets"]) == ["x", "y", "z"]
+    assert RuleEngine._merge_overlapping(regions[:2]) == regions[:2]
+
+
+def test_terminal_regions(engine):
+    for state in STATES:
+        regions = engine.terminal_regions(state)
+        assert names(regions) == ["toast"]
+        assert "我知道了" not in regions[0]["targets"]
+
+
+def test_terminal_region_defaults_to_full_frame():
+    engine = RuleEngine({"rules": [{"name": "end", "match": ["结束"], "action": "end"}]})
+    assert engine.terminal_regions(None) == [{"name": "full", "rect": (0.0, 0.0, 1.0, 1.0), "targets": ["结束"]}]
+
+
+def test_automaton_reports_overlapping_patterns():
+    automaton = AhoCorasick(["ab", "b", "abc", "bc"])
+    hits = sorted((end, automaton.patterns[index]) for end, index in automaton.iter("xabc"))
+    assert hits == [(2, "ab"), (2, "b"), (3, "abc"), (3, "bc")]
+
+
+def test_automaton_follows_failure_links():
+    automaton = AhoCorasick(["she", "he", "hers"])
+    hits = sorted((end, automaton.patterns[index]) for end, index in automaton.iter("ushers"))
+    assert hits == [(3, "he"), (3, "she"), (5, "hers")]
+
+
+def test_invalid_config_raises():
+    with pytest.raises(ValueError, match="未定义的区域"):
+        RuleEngine({"rules": [{"name": "a", "match": ["x"], "region": "missing"}]})
+    with pytest.raises(ValueError, match="action无效"):
+        RuleEngine({"rules": [{"name": "a", "match": ["x"], "action": "swipe"}]})
+
+
+def test_resolve_point():
+    assert resolve_point((0.9453, 0.0583), 1920, 1080) == (1815, 63)
+    assert resolve_point((1815, 63), 1280, 720) == (1210, 42)
+    assert resolve_point((0.5, 0.5), 1280, 720) == (640, 360)
@@ -2,184 +2,526 @@ import cv2
 import numpy as np
 import subprocess
 import os
+import struct
 import time
-import easyocr
-from PIL import Image, ImageDraw, ImageFont
+from pathlib import Path
 from logger_handler import logger
+from ocr_engine import get_ocr_engine
+from adb_transport import AdbError, get_transport, run_adb
+from frame_stream import FrameStream
+from frame_gate import FrameChangeGate
+from template_matcher import TemplateMatcher
+from pipeline import PipelinedRunner
+from actions import ActionVerifier, screen_changed
+from annotator import Annotator
+from flight_recorder import FlightRecorder, prune_directory
+from rule_engine import get_rule_engine, resolve_point, rules_path
+from layout_cache import LayoutCache
+from metrics import metrics
+import roi_profiles
+
+
+def run_cmd(cmd, binary=False):
+    """
+    运行命令并检查结果，不依赖OCR模型；binary为True时返回原始字节。
+
+    adb shell/exec-out命令直接通过adb server协议执行，其他命令（或adb server未启动时）才启动子进程。
+    """
+    try:
+        output = run_adb(cmd, binary)
+        if output is not None:
+            return output
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, shell=True)
+        return result.stdout if binary else result.stdout.decode()
+    except (subprocess.CalledProcessError, AdbError, OSError) as e:
+        # OSError包括adb server连接超时（socket.timeout）和连接被重置等情况
+        logger.error(f"命令执行失败：{cmd}", exc_info=True)
+        raise
+
+
+def run_batch(cmds, serial=None):
+    """
+    将多条设备端shell命令（如input tap/swipe）合并为一次往返执行。
+
+    主循环每帧只点击一次，目前没有调用方；供需要连续发送多条命令的脚本使用。
+    """
+    try:
+        return get_transport(serial).batch(cmds)
+    except (subprocess.CalledProcessError, AdbError, OSError) as e:
+        logger.error(f"批量命令执行失败：{cmds}", exc_info=True)
+        raise
+
+
+# screencap原始帧的像素格式（android.graphics.PixelFormat）
+PIXEL_FORMAT_RGBA_8888 = 1
+PIXEL_FORMAT_RGBX_8888 = 2
+PIXEL_FORMAT_BGRA_8888 = 5
+
+
+def decode_raw_frame(data):
+    """将`screencap`（不带-p）输出的原始帧解码为BGR格式的NumPy数组"""
+    if len(data) < 12:
+        raise ValueError(f"原始帧数据过短：{len(data)}字节")
+    width, height, pixel_format = struct.unpack_from('<III', data, 0)
+    pixel_bytes = width * height * 4
+    # Android 9之前帧头为12字节，之后追加了4字节的色彩空间字段
+    header_size = len(data) - pixel_bytes
+    if header_size not in (12, 16):
+        raise ValueError(f"无法解析原始帧：{width}x{height}，数据长度{len(data)}")
+    pixels = np.frombuffer(data, dtype=np.uint8, count=pixel_bytes, offset=header_size).reshape(height, width, 4)
+    if pixel_format == PIXEL_FORMAT_BGRA_8888:
+        return cv2.cvtColor(pixels, cv2.COLOR_BGRA2BGR)
+    return cv2.cvtColor(pixels, cv2.COLOR_RGBA2BGR)
+
 
 class ScreenAutomation:
-    def __init__(self):
-        self.reader = easyocr.Reader(['ch_sim'])
-        self.text_to_find = ["进入避难所", "我知道了", "购物", "760,"]  # 要查找的文本列表
-        self.special_clicks = {
-            "前往": (1815, 63),
-            "收藏图鉴": (1815, 63),
-            "神秘罗盘": (1815, 63),
-            "常规活动": (1815, 63),
-            "推荐商城": (1815, 63),
-            "尊享会员": (1815, 63),
-            "获奖记录": (1815, 63),
-            "自动整理": (1815, 63),
-            "一键领取": (1815, 63),
-            "尊敬的萤火虫特遣队员们": (1576, 204),
-
-        }
+    def __init__(self, capture_mode="raw", debug_save=False, use_roi=True, roi_fallback=True, roi_fallback_every=3,
+                 ocr_gate_threshold=2.0, use_templates=True, serial=None, special_clicks=None, rules=rules_path,
+                 annotate=True, marked_format="png", marked_quality=90, marked_scale=1.0, output_dir=None,
+                 use_layout_cache=True, layout_key=None):
+        """
+        Parameters:
+            capture_mode: 截图方式，"raw"通过exec-out直接读取原始帧到内存，"file"沿用截图-拉取-删除的方式，
+                          "stream"使用screenrecord持续帧流，帧流不可用时回退到"raw"
+            debug_save: 为True时才将原始截图写入磁盘，便于排查问题
+            use_roi: 是否只识别当前界面状态下规则可能命中的区域（见rules.yaml），为False时始终全屏识别
+            roi_fallback: 区域识别未命中时是否再进行一次全屏识别
+            roi_fallback_every: 连续未命中多少次才回退到全屏识别；界面状态变化后的第一次未命中总是回退
+            ocr_gate_threshold: 画面变化阈值，画面（或区域）变化低于该值时复用上次识别结果，为None时每次都识别
+            use_templates: 是否在OCR之前先用模板匹配查找固定界面元素
+            serial: 设备序列号，多设备时所有adb命令都通过-s指定设备
+            special_clicks: 按文本覆盖规则中的固定点击坐标，值为该设备的像素坐标或按屏幕比例声明的小数
+            rules: 规则文件路径，文本、点击坐标、结束条件和界面状态都在其中配置
+            annotate: 是否保存标注了文本框和点击点的图像，为False时完全不绘制
+            marked_format: 标注图格式，"png"、"jpeg"或"webp"
+            marked_quality: 标注图质量（0-100）
+            marked_scale: 标注图缩放比例
+            output_dir: 截图、标注图和飞行记录的保存目录，默认为D:\\CODE\\YHTJ\\out_files
+            use_layout_cache: 是否使用布局缓存，锚点校验通过时按缓存位置点击，跳过OCR
+            layout_key: 布局缓存的设备标识，默认为序列号
+        """
+        self.ocr = get_ocr_engine()  # 进程内共享的OCR引擎，首次识别时才加载模型
+        self.rules = get_rule_engine(rules)  # 编译后的规则，同一进程内只编译一次
+        self.state = self.rules.initial_state  # 当前界面状态，决定识别哪些区域
+        self.special_clicks = dict(special_clicks or {})
+        self.serial = serial
+        self.adb = f"adb -s {serial}" if serial else "adb"
+        self.capture_mode = capture_mode
+        self.debug_save = debug_save
+        self.frame_stream = None
+        self.use_roi = use_roi
+        self.roi_fallback = roi_fallback
+        self.roi_fallback_every = roi_fallback_every
+        self._roi_misses = 0  # 区域识别连续未命中的次数
+        self._fallback_state = None  # 上次全屏识别时的界面状态
+        self.frame_gate = FrameChangeGate(ocr_gate_threshold) if ocr_gate_threshold is not None else None
+        self.templates = TemplateMatcher() if use_templates else None
+        self.layout = None
+        if use_layout_cache:
+            layout_file = None
+            if output_dir is not None:
+                layout_file = Path(output_dir) / 'layout_cache' / 'layout.json'
+            self.layout = LayoutCache(layout_key or serial or "default", layout_file)
+        self._force_ocr = False  # 上一帧按布局缓存点击后，这一帧必须经过OCR
+        self.last_tap_ok = None  # 上一次点击后画面是否按预期变化，异步点击时为None
+        self.first_tap_at = None  # 第一次点击的时间（time.time()），用于统计与购买时间的偏差
+        self.action_dispatcher = None  # 流水线模式下由PipelinedRunner设置，点击改为异步执行
+        self.verifier = ActionVerifier(self)  # 点击后等待界面响应，取代固定sleep
+        self._baseline = None  # 当前画面（标注前）的签名，用于判断点击后画面是否变化
         self.save_path = "D:\\CODE\\YHTJ\\out_files\\screenshots"
         self.marked_path = "D:\\CODE\\YHTJ\\out_files\\marked_screens"
+        if output_dir is not None:
+            self.save_path = os.path.join(output_dir, 'screenshots')
+            self.marked_path = os.path.join(output_dir, 'marked_screens')
 
         self._create_directory(self.save_path)
         self._create_directory(self.marked_path)
+        # 标注图由后台线程绘制和写入，点击不等待图像编码
+        self.annotator = Annotator(self.marked_path, marked_format, marked_quality, marked_scale, enabled=annotate)
+        self._annotation = None  # 当前画面的标注
+        # 最近的画面、识别结果和动作只保存在内存中，运行失败或遇到结束条件时才写入磁盘
+        self.recorder = FlightRecorder(name=serial or "")
+        if output_dir is not None:
+            self.recorder.output_dir = Path(output_dir) / 'flight_records'
 
     def _create_directory(self, path):
         """创建目录"""
         if not os.path.exists(path):
             os.makedirs(path)
 
-    def _run_cmd(self, cmd):
+    @property
+    def reader(self):
+        """共享的easyocr.Reader，访问时才加载模型"""
+        return self.ocr.reader
+
+    def _run_cmd(self, cmd, binary=False):
         """运行命令并检查结果"""
-        try:
-            result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, shell=True)
-            return result.stdout.decode()
-        except subprocess.CalledProcessError as e:
-            logger.error("命令执行失败", exc_info=True)
-            raise
+        with metrics.span("adb"):
+            return run_cmd(cmd, binary)
 
+    @metrics.timed("capture")
     def _capture_screen(self):
         """捕获屏幕截图"""
         timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
         filename = f'screenshot_{timestamp}.png'
         full_path = os.path.join(self.save_path, filename)
         try:
-            self._run_cmd(f'adb shell screencap -p /sdcard/{filename}')
-            self._run_cmd(f'adb pull /sdcard/{filename} {full_path}')
-            self._run_cmd(f'adb shell rm /sdcard/{filename}')  # 删除设备上的临时文件
+            # 一次exec-out直接取回PNG，不再经过设备上的临时文件和adb pull
+            data = self._run_cmd(f'{self.adb} exec-out screencap -p', binary=True)
+            with open(full_path, 'wb') as f:
+                f.write(data)
             return full_path
         except Exception as e:
             logger.error("捕获屏幕截图失败", exc_info=True)
             return None
 
-    def _draw_bbox(self, result_image, bbox, text):
-        """在图像上绘制边界框和文本标记"""
+    @metrics.timed("capture")
+    def _capture_frame(self):
+        """通过一次exec-out调用读取原始帧，直接解码为内存中的图像"""
         try:
-            image = Image.fromarray(cv2.cvtColor(result_image, cv2.COLOR_BGR2RGB))
-            draw = ImageDraw.Draw(image)
+            data = self._run_cmd(f'{self.adb} exec-out screencap', binary=True)
+            with metrics.span("decode"):
+                frame = decode_raw_frame(data)
+        except Exception as e:
+            logger.error("捕获屏幕原始帧失败", exc_info=True)
+            return None
+        if self.debug_save:
+            timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
+            cv2.imwrite(os.path.join(self.save_path, f'screenshot_{timestamp}.png'), frame)
+        return frame
 
-            font_path = "C:\\Windows\\Fonts\\STKAITI.TTF"  # 确保这个路径是正确的
-            font = ImageFont.truetype(font_path, 48)
+    def _stream_frame(self):
+        """从持续帧流中取最新帧，帧流不可用时回退到单帧截图"""
+        if self.frame_stream is None:
+            self.frame_stream = FrameStream(adb_cmd=self.adb)
+            self.frame_stream.start()
+        frame = self.frame_stream.latest()
+        if frame is None:
+            if not self.frame_stream.alive:
+                logger.warning(f"屏幕帧流不可用，回退到单帧截图：{self.frame_stream.stats()}")
+            return self._capture_frame()
+        return frame
 
-            draw.rectangle([(bbox[0][0], bbox[0][1]), (bbox[2][0], bbox[2][1])], outline=(0, 255, 0), width=2)
-            draw.text((bbox[0][0], bbox[0][1] - 20), text, font=font, fill=(225, 0, 255))
+    def close(self):
+        """释放截图资源，写完标注图并结束写入线程，保存布局缓存，并按配额清理旧的截图和标注图"""
+        self.annotator.close()
+        if self.layout is not None:
+            self.layout.save()
+        prune_directory(self.marked_path, max_files=500, max_age=7 * 24 * 3600)
+        # file截图方式和debug_save每帧都会写入截图，只保留最近一天、最多200张
+        prune_directory(self.save_path, max_files=200, max_age=24 * 3600, suffixes=(".png",))
+        if self.frame_stream is not None:
+            self.frame_stream.stop()
+            self.frame_stream = None
 
-            result_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-            return result_image
-        except Exception as e:
-            logger.error("绘制边界框和文本失败：{}".format(e), exc_info=True)
-            return result_image
+    def _grab_frame(self):
+        """按截图方式获取当前屏幕图像，OCR与标注共用同一个数组"""
+        if self.capture_mode == "stream":
+            return self._stream_frame()
+        if self.capture_mode == "raw":
+            return self._capture_frame()
+        screen_path = self._capture_screen()
+        if screen_path is None:
+            return None
+        frame = cv2.imread(screen_path)
+        if frame is None:
+            logger.error("无法读取屏幕截图")
+        return frame
+
+    def _draw_bbox(self, result_image, bbox, text):
+        """记录要在图像上绘制的边界框和文本标记，保存时统一绘制"""
+        if self._annotation is not None:
+            self._annotation.add_box(bbox, text)
+        return result_image
 
     def _draw_click_point(self, result_image, x, y, radius=15, color=(0, 255, 0)):
-        """在图像上绘制点击点"""
-        if 0 <= x < result_image.shape[1] and 0 <= y < result_image.shape[0]:
-            cv2.circle(result_image, (x, y), radius, color, -1)
+        """记录要在图像上绘制的点击点"""
+        if self._annotation is not None:
+            self._annotation.add_point(x, y, radius, color)
         return result_image
 
-    def _click_position(self, x, y, result_image):
-        """模拟点击操作，并在图像上绘制点击点"""
+    @metrics.timed("click")
+    def _click_position(self, x, y, result_image, expect=None, name="tap"):
+        """模拟点击操作并等待预期条件（默认为画面变化），在图像上绘制点击点"""
+        self.recorder.record("tap", x=x, y=y, name=name)
+        if self.first_tap_at is None:
+            self.first_tap_at = time.time()
+        self.last_tap_ok = None
         try:
-            self._run_cmd(f'adb shell input tap {x} {y}')
-            time.sleep(2)
+            if self.action_dispatcher is not None:
+                self.action_dispatcher.tap(x, y)
+            else:
+                self.last_tap_ok = self.verifier.tap(x, y, expect=expect, baseline=self._baseline, name=name)
             # 绘制点击点
             result_image = self._draw_click_point(result_image, x, y, radius=15, color=(0, 255, 0))
             return result_image
         except Exception as e:
+            self.last_tap_ok = False
             logger.error("点击操作失败", exc_info=True)
             return result_image
 
-    def _find_target_text(self, text):
-        """检查文本是否包含目标文本"""
-        return any(target_text in text for target_text in self.text_to_find)
-
-    def _handle_special_clicks(self, text, result_image):
-        """处理特殊文本点击"""
-        for keyword, (x, y) in self.special_clicks.items():
-            if keyword in text:
-                logger.info(f"检测到:{text} ,点击位置 {x},{y}")
-                result_image = self._click_position(x, y, result_image)
-                return True, result_image
-        return False, result_image
-
     def _process_found_text(self, result_image, bbox, text, x_center, y_center):
         """处理找到的文本"""
         result_image = self._draw_bbox(result_image, bbox, text)
         return result_image
 
     def _save_marked_image(self, image, filename):
-        """保存带有标记的图像"""
-        try:
-            marked_path = os.path.join(self.marked_path, filename)
-            cv2.imwrite(marked_path, image)
-            logger.info(f"保存带有标记的图像: {marked_path}")
-        except Exception as e:
-            logger.error(f"保存带有标记的图像失败: {e}", exc_info=True)
+        """提交带有标记的图像，由后台线程绘制并保存"""
+        self.annotator.submit(self._annotation, filename)
 
-    def find_and_click_text(self):
-        """在屏幕截图中查找并点击特定文字"""
-        screen_path = self._capture_screen()
-        if screen_path is None:
-            return False, None, ""
+    def _readtext(self, key, image):
+        """识别图像文本，画面未变化时复用该区域上次的结果"""
+        if self.frame_gate is None:
+            return self.ocr.readtext(image)
+        return self.frame_gate.readtext(key, image, self.ocr.readtext)
+
+    def _ocr_regions(self, frame, regions=None):
+        """只识别当前界面状态下规则可能命中的区域（或指定的区域），坐标映射回屏幕坐标"""
+        result = []
+        for region in self.rules.active_regions(self.state) if regions is None else regions:
+            crop, offset = roi_profiles.crop_region(frame, region)
+            if crop.size == 0:
+                continue
+            region_result = roi_profiles.map_to_screen(self._readtext(region["name"], crop), offset)
+            result += roi_profiles.filter_targets(region_result, region)
+        return result
 
-        result_image = cv2.imread(screen_path)
+    def _is_end_condition(self, text):
+        """检查文本是否为结束条件"""
+        return self.rules.is_terminal(text)
+
+    def find_and_click_text(self, frame=None):
+        """在屏幕截图中查找并点击特定文字，frame为空时先截取当前屏幕"""
+        result_image = self._grab_frame() if frame is None else frame
         if result_image is None:
-            logger.error("无法读取屏幕截图")
             return False, None, ""
+        self._baseline = self.verifier.signature(result_image)
+        self._annotation = self.annotator.new(result_image)
+        self.recorder.record_frame(result_image, state=self.state)
+
+        # 按布局缓存点击后的下一帧必须经过OCR：锚点校验只能确认该元素仍在原位，
+        # 不能确认画面中没有更高优先级的规则（如结束条件）可以命中
+        force_ocr, self._force_ocr = self._force_ocr, False
+        if self.layout is not None and not force_ocr:
+            hit = self.layout.find(result_image, self.rules.active_rules(self.state))
+            if hit is not None:
+                return self._act_on_layout(hit, result_image)
+
+        if self.templates and not force_ocr:
+            hit = self.templates.find(result_image)
+            if hit is not None:
+                acted = self._act_on_template(hit, result_image)
+                if acted is not None:
+                    return acted
+
+        if self.use_roi:
+            state = self.state
+            found, result_image, text = self._act_on_results(self._ocr_regions(result_image), result_image, state)
+            if found:
+                self._roi_misses = 0
+                return found, result_image, text
+            self._roi_misses += 1
+            if not self._should_fallback(state):
+                return found, result_image, text
+            logger.info(f"区域识别未命中（{state}），回退到全屏识别")
+            self._roi_misses = 0
+            self._fallback_state = state
+
+        # 全屏识别时所有规则都参与匹配，界面状态判断有误时也能恢复
+        return self._act_on_results(self._readtext("full", result_image), result_image)
 
-        result = self.reader.readtext(screen_path)
+    def _should_fallback(self, state):
+        """
+        区域识别未命中时是否回退到全屏识别。
+
+        区域已覆盖整个画面时不回退；界面状态变化后的第一次未命中立即回退，以便纠正错误的状态判断，
+        之后每连续未命中roi_fallback_every次才回退一次，画面上没有可操作元素时不必每次都全屏识别。
+        """
+        if not self.roi_fallback or roi_profiles.covers_frame(self.rules.active_regions(state)):
+            return False
+        return state != self._fallback_state or self._roi_misses >= self.roi_fallback_every
+
+    def _check_end_conditions(self, result_image):
+        """
+        不经过OCR的点击（模板匹配、布局缓存）之前识别结束条件所在的区域。
+
+        画面中出现结束条件时按结束条件处理并返回结果，否则返回None；
+        只识别结束条件的区域，其中的其他文本不会触发点击。
+        """
+        regions = self.rules.terminal_regions(self.state)
+        if not regions:
+            return None
+        result = self._ocr_regions(result_image, regions)
+        hit = self.rules.match([text for _, text, _ in result], self.state)
+        if hit is None or not hit[1].is_terminal:
+            return None
+        return self._act_on_results(result, result_image, self.state)
+
+    def _act_on_template(self, hit, result_image):
+        """
+        模板匹配命中时按对应的规则处理，跳过全屏OCR。
+
+        模板文本对应的规则在当前状态下不生效时返回None，由OCR处理；点击前先识别结束条件所在的区域，
+        结束条件优先于模板点击（如账号在别处登录时不会点击登录）。
+        """
+        text = hit["text"]
+        match = self.rules.match([text], self.state)
+        if match is None:
+            logger.debug(f"模板{hit['name']}对应的规则在当前状态（{self.state}）下不生效，忽略")
+            return None
+        rule = match[1]
+        if not rule.is_terminal:
+            ended = self._check_end_conditions(result_image)
+            if ended is not None:
+                return ended
+        self.recorder.record("template", name=hit["name"], score=round(float(hit["score"]), 3))
+        timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
+        if rule.is_terminal:
+            logger.info(f"模板匹配找到结束条件：{text}")
+            self._save_marked_image(result_image, f"{timestamp} end_condition.png")
+            return True, result_image, text
+        logger.info(f"模板匹配:{hit['name']}({hit['score']:.2f}) ,点击位置 ({hit['x']}, {hit['y']})")
+        result_image = self._process_found_text(result_image, hit["bbox"], text, hit["x"], hit["y"])
+        result_image = self._click_position(hit["x"], hit["y"], result_image, name="template_tap")
+        if self.layout is not None:
+            self._learn_layout([(hit["bbox"], text, hit["score"])], result_image)
+        self.state = self.rules.next_state(rule, self.state)
+        self._save_marked_image(result_image, f"{timestamp} template_{hit['name']}.png")
+        return True, result_image, text
+
+    def _act_on_results(self, result, result_image, state=None):
+        """根据识别结果匹配规则，执行点击或判断结束条件；state为None时所有规则都参与匹配"""
         for (bbox, text, prob) in result:
-            print(f"检测到文本：{text}")
-            x_center = int((bbox[0][0] + bbox[2][0]) / 2)
-            y_center = int((bbox[0][1] + bbox[2][1]) / 2)
-
-            # 检查特殊点击
-            found_special, result_image = self._handle_special_clicks(text, result_image)
-            if found_special:
-                timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
-                self._save_marked_image(result_image, f"{timestamp} special_click.png")
-                return True, result_image, text
-
-            # 检查是否是特殊结束条件
-            if "已达到购买上限" in text or "商品库存不足" in text or "库存: 0" in text or "账号在别处登录" in text:
-                logger.info(f"找到结束条件：{text}")
-                timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
-                self._save_marked_image(result_image, f"{timestamp} end_condition.png")
-                return True, result_image, text  # 这个返回将会导致外部循环结束
-
-            # 检查普通文本
-            if self._find_target_text(text) or text in ["登录", "商店"]:
-                result_image = self._process_found_text(result_image, bbox, text, x_center, y_center)
-                result_image = self._click_position(x_center, y_center, result_image)
-                timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
-                self._save_marked_image(result_image, f"{timestamp} found_{text}.png")
-                return True, result_image, text
-
-        return False, result_image, ""
-
-    def run_main(self):
-        """主函数"""
+            logger.debug(f"检测到文本：{text}")
+        self.recorder.record("ocr", state=state, texts=[[text, round(float(prob), 3)] for _, text, prob in result])
+        with metrics.span("match"):
+            hit = self.rules.match([text for _, text, _ in result], state)
+        if self.layout is not None:
+            self._learn_layout(result, result_image)
+        if hit is None:
+            return False, result_image, ""
+        index, rule, pattern = hit
+        self.recorder.record("rule", name=rule.name, text=result[index][1])
+        bbox, text, prob = result[index]
+        timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
+
+        if rule.is_terminal:
+            # 这个返回将会导致外部循环结束
+            logger.info(f"找到结束条件：{text}")
+            self._save_marked_image(result_image, f"{timestamp} end_condition.png")
+            return True, result_image, text
+
+        if rule.action == "tap_point":
+            x, y = self._tap_point(rule, pattern, result_image)
+            logger.info(f"检测到:{text} ,点击位置 {x},{y}")
+            result_image = self._click_position(x, y, result_image, name="special_click")
+            filename = f"{timestamp} special_click.png"
+        else:
+            x_center, y_center = self._bbox_center(bbox)
+            result_image = self._process_found_text(result_image, bbox, text, x_center, y_center)
+            result_image = self._click_position(x_center, y_center, result_image, name="text_tap")
+            filename = f"{timestamp} found_{text}.png"
+        self.state = self.rules.next_state(rule, self.state)
+        self._save_marked_image(result_image, filename)
+        return True, result_image, text
+
+    def _tap_point(self, rule, pattern, image):
+        """tap_point规则的点击坐标，special_clicks中的坐标优先"""
+        height, width = image.shape[:2]
+        if pattern in self.special_clicks:
+            return resolve_point(self.special_clicks[pattern], width, height, reference=(width, height))
+        return rule.point_at(width, height)
+
+    @staticmethod
+    def _bbox_center(bbox):
+        return int((bbox[0][0] + bbox[2][0]) / 2), int((bbox[0][1] + bbox[2][1]) / 2)
+
+    def _learn_layout(self, result, image):
+        """把识别结果中命中规则的文本框记录为布局锚点"""
+        for bbox, text, _ in result:
+            hit = self.rules.match([text])
+            if hit is not None:
+                self.layout.learn(image, hit[1], hit[2], text, bbox)
+
+    def _act_on_layout(self, hit, result_image):
+        """
+        布局缓存的锚点校验通过时直接按缓存位置执行规则，跳过全屏OCR；点击没有生效时删除该锚点。
+
+        与模板匹配相同，点击前先识别结束条件所在的区域，结束条件优先于按缓存点击。
+        """
+        rule, text = hit["rule"], hit["text"]
+        if not rule.is_terminal:
+            ended = self._check_end_conditions(result_image)
+            if ended is not None:
+                return ended
+        self.recorder.record("layout", name=hit["key"], score=round(float(hit["score"]), 3))
+        timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
+        result_image = self._process_found_text(result_image, hit["bbox"], text, *self._bbox_center(hit["bbox"]))
+        if rule.is_terminal:
+            logger.info(f"布局缓存找到结束条件：{text}")
+            self._save_marked_image(result_image, f"{timestamp} end_condition.png")
+            return True, result_image, text
+
+        if rule.action == "tap_point":
+            x, y = self._tap_point(rule, hit["pattern"], result_image)
+        else:
+            x, y = self._bbox_center(hit["bbox"])
+        logger.info(f"布局缓存:{text}({hit['score']:.2f}) ,点击位置 ({x}, {y})")
+        result_image = self._click_position(x, y, result_image, name="layout_tap")
+        if self.last_tap_ok is False:
+            self.layout.invalidate(result_image, hit["key"])
+        self._force_ocr = True
+        self.state = self.rules.next_state(rule, self.state)
+        self._save_marked_image(result_image, f"{timestamp} layout_{rule.name}.png")
+        return True, result_image, text
+
+    def run_main(self, pipelined=False):
+        """主函数，pipelined为True时截图、识别和点击并行执行"""
         max_loops = 30  # 设置最大循环次数
         loop_count = 0  # 初始化循环计数器
+        outcome = "max_loops"  # 达到最大次数仍未遇到结束条件，同样保存飞行记录以便排查
 
-        while loop_count < max_loops:
-            found, result_image, matched_text = self.find_and_click_text()
-            if found and ("已达到购买上限" in matched_text or "商品库存不足" in matched_text or "库存: 0" in matched_text
-                          or "账号在别处登录" in matched_text):
-                logger.info("已达到购买上限或商品库存不足，退出整体循环")
-                break
-            elif found:
-                logger.info(f"第{loop_count+1}次运行中匹配到普通文本：'{matched_text}'，等待5秒后开始下一次循环")
-                time.sleep(1)
-            else:
-                logger.info(f"第{loop_count+1}次运行未匹配到文本，继续匹配")
-                time.sleep(1)
-            loop_count += 1  # 增加循环计数器
+        try:
+            with metrics.profile("run_main"):
+                if pipelined:
+                    if PipelinedRunner(self, max_loops=max_loops).run():
+                        outcome = "end_condition"
+                    return
+                frame = None  # 等待期间已截到的新画面，下一次循环直接识别，不再重新截图
+                while loop_count < max_loops:
+                    found, result_image, matched_text = self.find_and_click_text(frame)
+                    frame = None
+                    if found and self._is_end_condition(matched_text):
+                        logger.info("已达到购买上限或商品库存不足，退出整体循环")
+                        outcome = "end_condition"
+                        break
+                    elif found:
+                        # 点击时已等待画面响应，直接进入下一次循环
+                        logger.info(f"第{loop_count+1}次运行中匹配到普通文本：'{matched_text}'")
+                    else:
+                        logger.info(f"第{loop_count+1}次运行未匹配到文本，继续匹配")
+                        # 画面可能仍在加载，最多等待1秒，画面一变化就用变化后的这一帧开始下一次识别
+                        frame = self.verifier.wait(screen_changed(), self._baseline, name="idle", timeout=1)
+                    loop_count += 1  # 增加循环计数器
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            self.recorder.dump(outcome)
+            if self.frame_gate is not None:
+                stats = self.frame_gate.stats()
+                logger.info(f"OCR调用统计：执行{stats['executed']}次，画面未变化跳过{stats['skipped']}次")
+            if self.ocr.cache is not None:
+                stats = self.ocr.cache.stats()
+                logger.info(f"OCR识别缓存：命中{stats['hits']}次，未命中{stats['misses']}次，"
+                            f"命中率{stats['hit_ratio']:.1%}，节省识别时间约{stats['time_saved']:.2f}秒")
+                self.ocr.save_cache()
+            if self.layout is not None:
+                stats = self.layout.stats()
+                logger.info(f"布局缓存：{stats['anchors']}个锚点，命中{stats['hits']}次，未命中{stats['misses']}次，"
+                            f"失效{stats['invalidations']}次")
+            self.verifier.report()
+            self.close()
 
 if __name__ == '__main__':
     ScreenAutomation().run_main()